@@ -1,4 +1,5 @@
 from .binance import Binance
 from .binance_futures import BinanceFutures
 from .accounts import SpotAccount
-from .orderbooks import OrderBook
+from .orderbooks import OrderBook, TickOrderBook, OrderBookManager
+from .market_data import MarketDataWorker, SharedBookRing
@@ -1,9 +1,10 @@
-import asyncio, math
+import asyncio
 from contextlib import suppress
 from abc import ABC, abstractmethod
 from httpx import HTTPStatusError
+from decimal import ROUND_FLOOR, ROUND_CEILING
 
-from .exchanges import Position, OrderClosed
+from .exchanges import Position, OrderClosed, OrderPlacementError
 from .exchanges import Order, Fill
 
 import logging
@@ -85,6 +86,8 @@ class SpotAccount:
                     await self.get_fills(order_id)
 
     async def parse_update(self, update):
+        if update['type'] == 'order_update' or update['type'] == 'fill_update':
+            self.exchange.invalidate_account_cache()
         
         if update['type'] == 'order_update':
             order = update['order']
@@ -372,18 +375,25 @@ class SpotAccount:
         self.leverage = leverage
     
 
-    async def market_order(self, market, side, volume):
+    async def market_order(self, market, side, volume, max_slippage=None):
+        """
+            Place a market order
+                max_slippage: if set and the exchange holds an initialised order book for the market,
+                reject the order if its average fill price would be more than max_slippage basis points
+                from the mid price, or the book cannot fill it
+        """
+        if max_slippage is not None and market in self.exchange.order_books and self.exchange.order_books[market].initialised:
+            #fixed point books hold volumes in lots
+            book_volume = self.exchange.markets[market].lot.to_increments(volume) if self.exchange.fixed_point else volume
+            fill = self.exchange.order_books[market].fill_price(side, book_volume)
+            if not fill['filled'] or fill['slippage'] > max_slippage:
+                self.logger.warning(f"Rejecting {side} market order for {volume} on {market}, estimated slippage {fill['slippage']:.1f}bps")
+                raise OrderPlacementError(f"Estimated slippage {fill['slippage']:.1f}bps above {max_slippage}bps")
         await self.exchange.market_order(*self.keys, market, side, volume)
 
     async def limit_order(self, market, side, price, volume, **kwargs):
 
-        if side == 'buy': 
-            price = math.floor(price / self.exchange.markets[market].price_increment) * self.exchange.markets[market].price_increment + 10 ** -14
-            volume = math.floor(volume / self.exchange.markets[market].size_increment) * self.exchange.markets[market].size_increment
-        elif side == 'sell':
-            price = math.ceil(price / self.exchange.markets[market].price_increment) * self.exchange.markets[market].price_increment - 10 ** -14
-            volume = math.floor(volume / self.exchange.markets[market].size_increment) * self.exchange.markets[market].size_increment
-
-        
-        await self.exchange.limit_order(*self.keys, market, side, price, volume, **kwargs)
+        #the exchange rounds to whole ticks once, buys down and sells up, and volumes down to the lot
+        rounding = ROUND_FLOOR if side == 'buy' else ROUND_CEILING
+        await self.exchange.limit_order(*self.keys, market, side, price, volume, rounding=rounding, **kwargs)
 
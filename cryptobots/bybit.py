@@ -2,19 +2,21 @@ import asyncio, time, hashlib, hmac, urllib, json
 from abc import ABC, abstractmethod
 from .connections import ConnectionManager
 from contextlib import suppress
+from decimal import ROUND_HALF_EVEN
 import httpx
 from .orderbooks import OrderBook
-from .exchanges import Exchange, Fill, Position, SpotMarket, Order, FutureMarket, OrderPlacementError, OrderClosed
+from .exchanges import Exchange, Increment, Fill, Position, SpotMarket, Order, FutureMarket, OrderPlacementError, OrderClosed
 
 
 class Bybit(Exchange):
     rest_endpoint = 'https://api.bybit.com'
     ws_endpoint = 'wss://stream.bybit.com/v5'
+    account_endpoints = ['/api/v3/account', '/api/v3/openOrders', '/api/v3/myTrades']
 
-    def __init__(self):
+    def __init__(self, **options):
         self.user_ping_tasks = {}
         
-        super().__init__()
+        super().__init__(**options)
 
     async def connect(self):
         """
@@ -37,9 +39,11 @@ class Bybit(Exchange):
                 for data_filter in market_meta['filters']:
                     if data_filter['filterType'] == 'PRICE_FILTER':
                         market.price_increment  = float(data_filter['tickSize'])
+                        market.tick = Increment(data_filter['tickSize'])
 
                     if data_filter['filterType'] == 'LOT_SIZE':
                         market.size_increment = float(data_filter['stepSize'])
+                        market.lot = Increment(data_filter['stepSize'])
                         market.min_provide_size = float(data_filter['minQty'])        
                     if data_filter['filterType'] == 'MIN_NOTIONAL':
                         market.min_quote_volume = float(data_filter['minNotional'])
@@ -64,6 +68,10 @@ class Bybit(Exchange):
 
     #Market Data methods
     async def reconnect(self):
+        """
+            Close everything and connect from scratch, reloading the exchange info and discarding the
+            order books. See reconnect_websockets to only reopen the websockets.
+        """
         await self.unsubscribe_from_order_books(*self.order_books)
         await self.connection_manager.close()
 
@@ -71,6 +79,7 @@ class Bybit(Exchange):
         self.order_books = {}
         self.order_book_queues = {}
         self.market_names = {}
+        self.stream_handlers = {}
 
         self.parse_task.cancel()
 
@@ -92,10 +101,12 @@ class Bybit(Exchange):
         
 
 
-    async def subscribe_to_order_books(self, *markets):
+    async def subscribe_to_order_books(self, *markets, snapshot_directory=None, **book_options):
         """
             Subscibe to the orderbooks of markets
                 markets: tuple of (base, quote), eg (BTC, USDT), BTC, ETH)
+                snapshot_directory: warm start the books from the checkpoints written by save_order_books
+                book_options: passed to create_order_book, eg tick_ladder=True
         """
         async with self.connection_lock:
             to_subscribe = set(market for market in markets if market not in self.order_book_queues)  
@@ -105,28 +116,41 @@ class Bybit(Exchange):
             for market in to_subscribe:
                 if market not in self.markets:
                     raise Exception('Invalid Market ' + str(market) + ' not listed on exchange. Maybe exchange.connect() not been executed')
-                order_book_queue = asyncio.Queue()
-                self.order_book_queues[market] = order_book_queue
-                self.order_books[market] = OrderBook(order_book_queue)
-            ws_request = {'method': 'SUBSCRIBE', 'params':  [f'{self.markets[market].name.lower()}@depth@100ms' for market in to_subscribe]} 
+                self.create_order_book(market, **book_options)
+                self.add_stream_handler(self.depth_stream(market), self.parse_order_book_message, self.order_book_queues[market])
+            ws_request = {'method': 'SUBSCRIBE', 'params':  [self.depth_stream(market) for market in to_subscribe]} 
             
-            await self.connection_manager.ws_send(ws_request)
-            await asyncio.gather(*[self.get_order_book_snapshot(market) for market in to_subscribe])
+            subscribed = await self.connection_manager.ws_send(ws_request)
+            await subscribed
+            if snapshot_directory is None:
+                await asyncio.gather(*[self.get_order_book_snapshot(market) for market in to_subscribe])
+            else:
+                await asyncio.gather(*[self.restore_order_book(market, snapshot_directory) for market in to_subscribe])
             await asyncio.gather(*[self.order_books[market].initialised_event.wait() for market in to_subscribe])
 
+    def depth_stream(self, market):
+        return f'{self.markets[market].name.lower()}@depth@100ms'
+
     async def get_order_book_snapshot(self, market):
-        depth = await self.connection_manager.rest_get(f'/api/v3/depth', params={'symbol': self.markets[market].name, 'limit':100})
-        update = {'initial': True, 'bids': [[float(b), float(a)] for b, a in depth['bids']], 'asks': [[float(a), float(v)] for a, v in depth['asks']], 'time': int(depth['lastUpdateId'])} 
-        await self.order_book_queues[market].put(update)
+        await self.order_book_queues[market].put(await self.request_order_book_snapshot(market))
+
+    async def request_order_book_snapshot(self, market, limit=100):
+        depth = await self.connection_manager.rest_get(f'/api/v3/depth', params={'symbol': self.markets[market].name, 'limit':limit})
+        if self.fixed_point:
+            return {'initial': True, 'bids': self.fixed_point_levels(market, depth['bids']), 'asks': self.fixed_point_levels(market, depth['asks']), 'time': int(depth['lastUpdateId'])}
+        return {'initial': True, 'bids': [[float(b), float(a)] for b, a in depth['bids']], 'asks': [[float(a), float(v)] for a, v in depth['asks']], 'time': int(depth['lastUpdateId'])} 
     
     async def unsubscribe_from_order_books(self, *markets):
         """
             Unsubscribe from markets order books
         """
         async with self.connection_lock:
-            ws_requests = [{'method': 'UNSUBSCRIBE', 'params': ['f{self.markets[market].name}@depth@100ms' for market in markets]}]
+            ws_requests = [{'method': 'UNSUBSCRIBE', 'params': [self.depth_stream(market) for market in markets]}]
+            for market in markets:
+                self.remove_stream_handler(self.depth_stream(market))
             try:
-                await asyncio.wait_for(asyncio.gather(*[self.connection_manager.ws_send(req) for req in ws_requests]), 1)
+                sent = await asyncio.wait_for(asyncio.gather(*[self.connection_manager.ws_send(req) for req in ws_requests]), 1)
+                await asyncio.wait_for(asyncio.gather(*sent), 1)
             except Exception as e:
                 print(e)
             try: 
@@ -137,37 +161,23 @@ class Bybit(Exchange):
                 del self.order_books[market]
     
     def check_order_books(self):
-        return sum(book.ftx_checksum() for book in self.order_books.values()) == len(self.order_books)  
+        '''False if the last verification of any book found it had drifted, see start_order_book_verification'''
+        return all(book.correct is not False for book in self.order_books.values())
 
     async def check_connection(self):
         return await self.connection_manager.check_connection()  
 
 
-    async def ws_parse(self):
-        """
-            Parse incomming websocket information
-        """
-        while True:
-            #get message from queue
-            try:
-                message = await self.connection_manager.ws_q.get()
-                if 'result' in message and message['result'] is None:
-                    continue
-                stream = message['stream']
-                if 'depth' in stream:
-                    await self.parse_order_book_message(message['data'])
-                elif stream in self.user_ping_tasks:
-                    await self.parse_user_update(message['data'])
-            except Exception as e:
-                print('Error in ws parse', e)
-                print(message)
-                raise e
-
-    async def parse_order_book_message(self, message):
-        message_data = {'time': message['u'], 'bids': [[float(b), float(v)] for b, v in message['b']], 'asks': [[float(a), float(v)] for a, v in message['a']]} 
-        await self.order_book_queues[self.market_names[message['s']]].put(message_data)
+    def parse_order_book_message(self, message, queue):
+        if self.fixed_point:
+            market = self.market_names[message['s']]
+            bids, asks = self.fixed_point_levels(market, message['b']), self.fixed_point_levels(market, message['a'])
+        else:
+            bids, asks = [[float(b), float(v)] for b, v in message['b']], [[float(a), float(v)] for a, v in message['a']]
+        message_data = {'time': message['u'], 'bids': bids, 'asks': asks} 
+        queue.put_nowait(message_data)
 
-    async def parse_user_update(self, message):
+    async def parse_user_update(self, message, target=None):
         if message['e'] == 'executionReport': 
             order_id = int(message['i'])
             market = self.markets[self.market_names[message['s']]]
@@ -209,39 +219,28 @@ class Bybit(Exchange):
 
     #Account Methods
 
-    def sign_params(api_key, secret_key, **kwargs):
-        params = {} if 'params' not in kwargs else kwargs['params']
-        headers = {} if 'headers' not in kwargs else kwargs['headers']
-        ts = int(time.time() * 1000)
-        params['timestamp'] = ts
-        params['signature'] = hmac.new(secret_key.encode('utf-8'), urllib.parse.urlencode(params).encode('utf-8'), hashlib.sha256).hexdigest()
-
-        headers['X-MBX-APIKEY'] = api_key
-        return params, headers
-
     async def signed_get(self, endpoint, api_key, secret_key, **kwargs):
         headers = {} if 'headers' not in kwargs else kwargs['headers']
         params = {} if 'params' not in kwargs else kwargs['params']
-        timestamp = int(time.time() * 1000)
-        params, headers = Binance.sign_params(api_key, secret_key, params=params, headers=headers)
+        params, headers = self.sign_params(api_key, secret_key, params=params, headers=headers)
         return await self.connection_manager.rest_get(endpoint, params=params, headers=headers)
 
     async def signed_post(self, endpoint, api_key, secret_key, **kwargs):   
         headers = {} if 'headers' not in kwargs else kwargs['headers']
         params = {} if 'params' not in kwargs else kwargs['params']
-        params, headers = Binance.sign_params(api_key, secret_key, params=params, headers=headers)
+        params, headers = self.sign_params(api_key, secret_key, params=params, headers=headers)
         return await self.connection_manager.rest_post(endpoint, params=params, headers=headers)
 
     async def signed_delete(self, endpoint, api_key, secret_key, **kwargs):
         headers = {} if 'headers' not in kwargs else kwargs['headers']
         params = {} if 'params' not in kwargs else kwargs['params']
-        params, headers = Binance.sign_params(api_key, secret_key, params=params, headers=headers)
+        params, headers = self.sign_params(api_key, secret_key, params=params, headers=headers)
         return await self.connection_manager.rest_delete(endpoint, params=params, headers=headers)
 
     async def signed_put(self, endpoint, api_key, secret_key, **kwargs):
         headers = {} if 'headers' not in kwargs else kwargs['headers']
         params = {} if 'params' not in kwargs else kwargs['params']
-        params, headers = Binance.sign_params(api_key, secret_key, params=params, headers=headers)
+        params, headers = self.sign_params(api_key, secret_key, params=params, headers=headers)
         return await self.connection_manager.rest_put(endpoint, params=params, headers=headers)
         
     
@@ -251,7 +250,9 @@ class Bybit(Exchange):
         self.user_key = key
         self.user_api = api_key
         ws_request = {'method': 'SUBSCRIBE', 'params': [key]}
-        await self.connection_manager.ws_send(ws_request)    
+        self.add_stream_handler(key, self.parse_user_update)
+        subscribed = await self.connection_manager.ws_send(ws_request)
+        await subscribed
         self.user_ping_tasks[key] = asyncio.create_task(self.user_ping(api_key, key))
 
     async def user_ping(self, api_key, listen_key):
@@ -269,7 +270,7 @@ class Bybit(Exchange):
             'symbol': self.markets[market].name,
             'side': side.upper(),
             'type': 'MARKET',
-            'quantity': ('{0:.' + str(self.markets[market].base_asset_precision) +'f}').format(volume),
+            'quantity': self.markets[market].lot.format(self.markets[market].lot.floor(volume)),
         }
 
         try:
@@ -291,15 +292,16 @@ class Bybit(Exchange):
         await self.user_updates.put({'type': 'order_update', 'order': order})
 
 
-    async def limit_order(self, api_key, secret_key,  market, side, price, volume):
+    async def limit_order(self, api_key, secret_key,  market, side, price, volume, rounding=ROUND_HALF_EVEN):
+        '''Place a limit order, price is rounded to the tick with the decimal rounding mode and volume down to the lot'''
         if volume < self.markets[market].min_provide_size:
             raise ValueError(f"Volume {volume} below minimum {self.markets[market].min_provide_size} for market {self.markets[market].name}")
         params = {
             'symbol': self.markets[market].name,
             'side': side.upper(),
             'type': 'LIMIT',
-            'price': ('{0:.' + str(self.markets[market].price_precision) +'f}').format(price),
-            'quantity': ('{0:.' + str(self.markets[market].base_asset_precision) +'f}').format(volume),
+            'price': self.markets[market].tick.format(self.markets[market].tick.to_increments(price, rounding)),
+            'quantity': self.markets[market].lot.format(self.markets[market].lot.floor(volume)),
             'timeInForce': 'GTC'
         }
         try:
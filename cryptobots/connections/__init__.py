@@ -1 +1,6 @@
-from .connections import ConnectionManager
+from .connections import ConnectionManager, WebsocketRequestError
+from .decoders import get_decoder, TypedDecoder
+from .rate_limits import RateLimiter
+from .scheduling import RequestScheduler
+from .ws_api import WebsocketAPI
+from .signing import ServerClock, Signer, get_signer
@@ -1,46 +1,216 @@
 '''Module to manage connections to the Binance APIs'''
-import asyncio, json, datetime, hashlib, hmac, urllib, httpx, websockets
+import asyncio, json, datetime, hashlib, hmac, random, time, urllib, httpx, websockets
 from contextlib import suppress
+from collections import deque
+from .decoders import get_decoder
+from .rate_limits import RateLimiter
+from .scheduling import RequestScheduler, PRIORITIES, request_class
+from .http_pool import create_client, RequestTrace, ConnectionStats
+
+class WebsocketRequestError(Exception):
+    """
+        Exception raised when the websocket server replies to a request with an error
+    """
+    def __init__(self, request, error):
+        self.request = request
+        self.error = error
+        super().__init__(f"Websocket request {request} failed: {error}")
+
+
+class WebsocketConnection:
+    '''One websocket connection of the ConnectionManager pool and the streams subscribed on it'''
+    def __init__(self, index, max_messages_per_second = 5):
+        self.index = index
+        self.client = None
+        self.listener = None
+        self.open = False
+        self.send_lock = asyncio.Lock()
+        self.send_times = deque(maxlen=max_messages_per_second) #of the last requests, to pace them
+        self.streams = set()
+        self.messages = 0 #since the last rate sample
+        self.stream_messages = {}
+        self.rate = 0.0 #messages per second
+        self.stream_rates = {}
+
+    def sample_rates(self, elapsed):
+        self.rate = self.messages / elapsed
+        self.stream_rates = {stream: n / elapsed for stream, n in self.stream_messages.items()}
+        self.messages = 0
+        self.stream_messages = {}
+
+
+class StreamMove:
+    '''A stream moving from source to target, subscribed on both until source is unsubscribed. Messages are passed on
+        from source until target delivers one source has already passed on, then only from target, so each message
+        of the stream is passed on once and in order'''
+    def __init__(self, source, target):
+        self.source = source
+        self.target = target
+        self.delivered = set() #frames passed on from source
+        self.buffered = [] #(frame, message) from target before it caught up with source
+        self.moved = False
+
+    def receive(self, connection, frame, message):
+        '''Returns the messages to pass on once message arrives on connection, frame is the raw message'''
+        if connection is self.source:
+            if self.moved:
+                return []
+            self.delivered.add(frame)
+            frames = [f for f, _ in self.buffered]
+            if frame not in frames:
+                return [message]
+            self.moved = True
+            messages = [message] + [m for _, m in self.buffered[frames.index(frame) + 1:]]
+            self.buffered = []
+            return messages
+        if frame in self.delivered:
+            self.moved = True
+            return []
+        if self.moved:
+            return [message]
+        self.buffered.append((frame, message))
+        return []
+
+    def finish(self):
+        '''Returns the messages from target still held back once source has stopped delivering the stream'''
+        messages = [m for f, m in self.buffered if f not in self.delivered]
+        self.buffered = []
+        self.moved = True
+        return messages
+
 
 class ConnectionManager:
     '''Manage connections to the Binance APIs'''
-    def __init__(self, base_endpoint: str, ws_uri: str = None):
+    def __init__(self, base_endpoint: str, ws_uri: str = None, decoder = None, ws_connections = 1, max_streams_per_connection = 1024, max_message_rate = None, rebalance_interval = None, reconnect_delay = 0.5, max_reconnect_delay = 30, max_concurrent_requests = 10, request_concurrency = None, http_limits = None, http2 = False, warm_connections = 2, keep_warm_interval = None, warm_endpoint = '', cache_ttls = None, subscribe_batch_size = 200, max_ws_messages_per_second = 5, ws_request_timeout = 10, max_reconnect_attempts = None):
+        """
+            ws_connections: number of websocket connections to spread the stream subscriptions over,
+                more are opened when they all have max_streams_per_connection streams
+            max_message_rate: messages per second above which the busiest streams of a connection are
+                moved to the least loaded connection
+            rebalance_interval: seconds between measurements of the message rates. When set, dropped
+                connections are reopened and their streams resubscribed instead of closing the manager
+            reconnect_delay, max_reconnect_delay: bounds in seconds of the jittered exponential backoff
+                between attempts to reopen a websocket connection
+            max_reconnect_attempts: attempts to reopen a websocket connection before giving up, None to keep trying
+            max_concurrent_requests: rest requests in flight, free slots go to order requests first, then
+                account and then market data requests, see RequestScheduler
+            request_concurrency: {'order': cap, 'account': cap, 'market_data': cap} per class caps on the
+                requests in flight. A request's class can be set with the request_class keyword argument
+            http_limits, http2: rest connection pool settings, see http_pool.create_client
+            warm_connections: number of rest connections opened on connect, and kept open by keep warm
+            keep_warm_interval: seconds between requests to warm_endpoint on warm_connections connections in
+                the background, so the connections orders are sent on are never idle long enough to close
+            cache_ttls: {endpoint: seconds} to keep the responses of rest_get requests to endpoint for,
+                see set_cache_ttl. Identical rest_get requests in flight at the same time are always sent once
+            subscribe_batch_size: most streams in one SUBSCRIBE or UNSUBSCRIBE request, longer lists are split
+            max_ws_messages_per_second: requests sent on each websocket connection per second
+            ws_request_timeout: seconds to wait for the reply to a websocket request before failing it
+        """
         self.base_endpoint = base_endpoint
         self.ws_uri = ws_uri
+        self.decoder = get_decoder() if decoder is None else decoder #decodes each websocket frame before it is added to ws_q
         self.open = True
         self.subscribed_to_ws_stream = False
 
         self.httpx_client = None 
         self.ws_id = 0
-        self.ws_requests = {}
+        self.ws_requests = {} #{id: {'data': request, 'response': future, 'timeout': handle}} until the reply arrives or times out
+        self.subscribe_batch_size = subscribe_batch_size
+        self.max_ws_messages_per_second = max_ws_messages_per_second
+        self.ws_request_timeout = ws_request_timeout
         self.ws_q = asyncio.Queue()
+        self.ws_pool_size = ws_connections
+        self.ws_connections = []
+        self.stream_connections = {} #{stream: WebsocketConnection}
+        self.moving_streams = {} #{stream: StreamMove}
+        self.max_streams_per_connection = max_streams_per_connection
+        self.max_message_rate = max_message_rate
+        self.rebalance_interval = rebalance_interval
+        self.rebalance_task = None
+        self.restore_tasks = set()
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+        self.max_reconnect_attempts = max_reconnect_attempts
+        self.pool_lock = asyncio.Lock()
 
-        self.rest_requests = []
-        self.rest_request_limits = {} #{'timeperiod': number}
+        self.rate_limiter = None #RateLimiter, see set_rate_limits
+        self.scheduler = RequestScheduler(max_concurrent_requests, request_concurrency)
+        self.http_limits = http_limits
+        self.http2 = http2
+        self.warm_connections = warm_connections
+        self.keep_warm_interval = keep_warm_interval
+        self.warm_endpoint = warm_endpoint
+        self.keep_warm_task = None
+        self.connection_stats = ConnectionStats()
+        self.in_flight = {} #{request key: task}
+        self.cache_ttls = {} if cache_ttls is None else dict(cache_ttls)
+        self.cache = {} #{request key: (expiry, response text)}
+        self.cache_generation = 0 #incremented by invalidate so responses requested before are not cached
         
 
     async def connect(self): 
         if self.ws_uri is not None:
-            self.ws_client = await websockets.connect(self.ws_uri, ssl=True, compression=None)
-            self.ws_listener = asyncio.create_task(self.ws_listen())
+            self.ws_connections = [WebsocketConnection(i, self.max_ws_messages_per_second) for i in range(self.ws_pool_size)]
+            self.stream_connections = {}
+            await asyncio.gather(*[self.open_ws_connection(connection) for connection in self.ws_connections])
+            self.ws_client = self.ws_connections[0].client
             self.subscribed_to_ws_stream = True
-        self.httpx_client = httpx.AsyncClient()
+            if self.rebalance_interval is not None:
+                self.rebalance_task = asyncio.create_task(self.rebalance_ws_connections())
+        self.httpx_client = create_client(self.http_limits, self.http2)
         self.open = True
+        await self.warm_up()
+        if self.keep_warm_interval is not None:
+            self.keep_warm_task = asyncio.create_task(self.keep_warm())
 
+    async def warm_up(self):
+        '''Open warm_connections rest connections, or keep those already open from expiring'''
+        async def request():
+            trace = RequestTrace()
+            await self.httpx_client.get(self.base_endpoint + self.warm_endpoint, extensions={'trace': trace})
+            self.connection_stats.record('warm up', trace)
+        try:
+            await asyncio.gather(*[request() for _ in range(self.warm_connections)])
+        except Exception as e:
+            print('Error warming up connections', e)
+
+    async def keep_warm(self):
+        while True:
+            await asyncio.sleep(self.keep_warm_interval)
+            await self.warm_up()
+
+    async def open_ws_connection(self, connection):
+        connection.client = await websockets.connect(self.ws_uri, ssl=True, compression=None)
+        connection.open = True
+        connection.listener = asyncio.create_task(self.ws_listen(connection))
 
     async def close(self):
         '''Close the open connections'''
         self.open = False
+        if self.keep_warm_task is not None:
+            self.keep_warm_task.cancel()
+            with suppress(asyncio.CancelledError):
+                await self.keep_warm_task
+            self.keep_warm_task = None
         await self.httpx_client.aclose()
+        if self.rebalance_task is not None:
+            self.rebalance_task.cancel()
+            with suppress(asyncio.CancelledError):
+                await self.rebalance_task
+            self.rebalance_task = None
+        for task in list(self.restore_tasks):
+            task.cancel()
         if self.subscribed_to_ws_stream:
-            await self.ws_client.close()
-            await self.ws_listener
+            for connection in self.ws_connections:
+                await connection.client.close()
+                await connection.listener
         self.subscribed_to_ws_stream = False
     
     async def check_connection(self, timeout = 5):
         try:
             if self.subscribed_to_ws_stream:
-                await asyncio.wait_for(asyncio.gather(self.rest_get(''), self.ws_client.ping()), timeout)
+                pings = [connection.client.ping() for connection in self.ws_connections if connection.open]
+                await asyncio.wait_for(asyncio.gather(self.rest_get(''), *pings), timeout)
             else:
                 await asyncio.wait_for(self.rest_get(''), timeout)
             return True
@@ -49,39 +219,321 @@ class ConnectionManager:
             raise
             
 
-    async def ws_listen(self):
+    async def ws_listen(self, connection):
         '''Listen to incoming ws messages and adds the data to the processing queue'''
+        count_streams = self.max_message_rate is not None
         try:
-            async for message in self.ws_client:
-                await self.ws_q.put(json.loads(message))
+            async for frame in connection.client:
+                message = self.decoder(frame)
+                connection.messages += 1
+                if 'stream' not in message:
+                    if 'id' in message and message['id'] in self.ws_requests:
+                        self.ws_reply(message)
+                        continue
+                else:
+                    stream = message['stream']
+                    if count_streams:
+                        connection.stream_messages[stream] = connection.stream_messages.get(stream, 0) + 1
+                    if stream in self.moving_streams:
+                        for message in self.moving_streams[stream].receive(connection, frame, message):
+                            await self.ws_q.put(message)
+                        continue
+                await self.ws_q.put(message)
         except Exception as e:
             print('Error in Connection.ws_listen', e)
             #raise e
         finally:
-            self.open = False
+            connection.open = False
+            if not self.open or self.rebalance_interval is None:
+                self.open = False
+            else:
+                task = asyncio.create_task(self.restore_ws_connection(connection))
+                self.restore_tasks.add(task)
+                task.add_done_callback(self.restore_tasks.discard)
 
-    async def ws_send(self, data: dict):
-        '''Send data to the websocket server'''
-        data['id'] = self.ws_id
-            
-        self.ws_requests[self.ws_id] = {'data': data, 'response': None}
+    async def reopen_ws_connection(self, connection):
+        '''Reopen a connection, retrying with jittered exponential backoff, raises the last error after max_reconnect_attempts'''
+        delay = self.reconnect_delay
+        attempts = 0
+        while True:
+            try:
+                await self.open_ws_connection(connection)
+                return
+            except Exception as e:
+                print('Error reopening websocket connection', e)
+                attempts += 1
+                if self.max_reconnect_attempts is not None and attempts >= self.max_reconnect_attempts:
+                    raise
+                await asyncio.sleep(random.uniform(delay / 2, delay))
+                delay = min(delay * 2, self.max_reconnect_delay)
+
+    async def restore_ws_connection(self, connection):
+        '''Reopen a dropped connection and spread its streams over the pool, over the other connections if it can not be reopened'''
+        async with self.pool_lock:
+            streams = list(connection.streams)
+            connection.streams = set()
+            for stream in streams:
+                del self.stream_connections[stream]
+            try:
+                await self.reopen_ws_connection(connection)
+            except Exception as e:
+                print('Gave up reopening websocket connection', connection.index, e)
+        if self.open and len(streams) > 0:
+            try:
+                await (await self.ws_send({'method': 'SUBSCRIBE', 'params': streams}))
+            except Exception as e:
+                print('Error resubscribing streams of websocket connection', connection.index, e)
+
+    async def reconnect(self):
+        '''Reopen the websocket connections in place and resubscribe each to its streams, keeping the rest client'''
+        self.open = False
+        for task in list(self.restore_tasks):
+            task.cancel()
+        async with self.pool_lock:
+            for connection in self.ws_connections:
+                with suppress(Exception):
+                    await connection.client.close()
+                    await connection.listener
+            await asyncio.gather(*[self.reopen_ws_connection(connection) for connection in self.ws_connections])
+            self.ws_client = self.ws_connections[0].client
+            self.subscribed_to_ws_stream = True
+            self.open = True
+            subscribed = []
+            for connection in self.ws_connections:
+                if len(connection.streams) > 0:
+                    subscribed.append(await self.ws_send({'method': 'SUBSCRIBE', 'params': list(connection.streams)}, connection))
+            await asyncio.gather(*subscribed)
+
+    async def rebalance_ws_connections(self):
+        '''Measure the message rates of the connections and move streams off saturated connections'''
+        while True:
+            await asyncio.sleep(self.rebalance_interval)
+            for connection in self.ws_connections:
+                connection.sample_rates(self.rebalance_interval)
+            if self.max_message_rate is None:
+                continue
+            for connection in self.ws_connections:
+                if not connection.open or connection.rate <= self.max_message_rate:
+                    continue
+                moves = {}
+                rate = connection.rate
+                for stream, stream_rate in sorted(connection.stream_rates.items(), key=lambda s: -s[1]):
+                    if rate <= self.max_message_rate:
+                        break
+                    if stream not in connection.streams:
+                        continue
+                    target = self.least_loaded_connection(exclude=connection)
+                    if target is None or target.rate + stream_rate > self.max_message_rate:
+                        continue
+                    target.rate += stream_rate
+                    rate -= stream_rate
+                    moves.setdefault(target, []).append(stream)
+                for target, streams in moves.items():
+                    await self.move_streams(streams, connection, target)
+
+    def least_loaded_connection(self, exclude = None):
+        '''The open connection with the lowest message rate and room for another stream'''
+        candidates = [c for c in self.ws_connections if c.open and c is not exclude and len(c.streams) < self.max_streams_per_connection]
+        if len(candidates) == 0:
+            return None
+        return min(candidates, key=lambda c: (c.rate, len(c.streams)))
+
+    async def move_streams(self, streams, source, target):
+        '''Subscribe to streams on target before unsubscribing on source so that no messages are missed,
+            messages delivered by both connections meanwhile are passed on once, see StreamMove'''
+        async with self.pool_lock:
+            for stream in streams:
+                self.moving_streams[stream] = StreamMove(source, target)
+            try:
+                await (await self.ws_send({'method': 'SUBSCRIBE', 'params': streams}, target))
+                await (await self.ws_send({'method': 'UNSUBSCRIBE', 'params': streams}, source))
+            except Exception as e:
+                print('Error moving streams', e)
+                return
+            finally:
+                for stream in streams:
+                    for message in self.moving_streams.pop(stream).finish():
+                        self.ws_q.put_nowait(message)
+            source.streams.difference_update(streams)
+            target.streams.update(streams)
+            for stream in streams:
+                self.stream_connections[stream] = target
+
+    async def assign_streams(self, streams):
+        '''Returns {connection: streams} spreading new streams over the least loaded connections'''
+        assigned = {}
+        async with self.pool_lock:
+            for stream in streams:
+                if stream in self.stream_connections:
+                    continue
+                connection = self.least_loaded_connection()
+                if connection is None:
+                    connection = WebsocketConnection(len(self.ws_connections), self.max_ws_messages_per_second)
+                    await self.open_ws_connection(connection)
+                    self.ws_connections.append(connection)
+                connection.streams.add(stream)
+                self.stream_connections[stream] = connection
+                assigned.setdefault(connection, []).append(stream)
+        return assigned
+
+    async def ws_send(self, data: dict, connection: WebsocketConnection = None):
+        '''Send data to the websocket server, SUBSCRIBE and UNSUBSCRIBE requests are routed to the connections of their streams
+            and split into batches of subscribe_batch_size streams, paced at max_ws_messages_per_second on each connection.
+            Returns a future that resolves to the list of results of the requests sent once they have all been
+            acknowledged, and raises WebsocketRequestError or asyncio.TimeoutError if any of them fail'''
+        method = data.get('method')
+        if connection is not None:
+            routed = [(connection, data.get('params'))]
+        elif method == 'SUBSCRIBE':
+            routed = list((await self.assign_streams(data['params'])).items())
+        elif method == 'UNSUBSCRIBE':
+            owners = {}
+            for stream in data['params']:
+                owner = self.stream_connections.pop(stream, self.ws_connections[0])
+                owner.streams.discard(stream)
+                owners.setdefault(owner, []).append(stream)
+            routed = list(owners.items())
+        else:
+            routed = [(self.ws_connections[0], data.get('params'))]
+        requests = []
+        for connection, params in routed:
+            if method in ('SUBSCRIBE', 'UNSUBSCRIBE'):
+                requests += [(connection, {**data, 'params': params[i:i + self.subscribe_batch_size]}) for i in range(0, len(params), self.subscribe_batch_size)]
+            else:
+                requests.append((connection, dict(data)))
+        replies = []
         try:
-            await self.ws_client.send(json.dumps(data))
+            for connection, request in requests:
+                replies.append(self.ws_expect_reply(request))
+                await self.ws_send_paced(connection, request)
+                self.ws_reply_timeout(request)
         except Exception as e:
+            for reply in replies:
+                reply.cancel()
             self.subscribed_to_ws_stream = False
             raise e
-            
+        if len(requests) > 0:
+            data['id'] = requests[-1][1]['id']
+        acknowledged = asyncio.gather(*replies)
+        acknowledged.add_done_callback(lambda future: future.cancelled() or future.exception())
+        return acknowledged
+
+    def ws_expect_reply(self, request):
+        '''Give request an id and return a future for the reply to it'''
+        request['id'] = self.ws_id
         self.ws_id += 1
-        return data['id']
+        reply = asyncio.get_running_loop().create_future()
+        self.ws_requests[request['id']] = {'data': request, 'response': reply, 'timeout': None}
+        def done(future, request_id = request['id']):
+            entry = self.ws_requests.pop(request_id, None)
+            if entry is not None and entry['timeout'] is not None:
+                entry['timeout'].cancel()
+            if not future.cancelled():
+                future.exception() #retrieved by the gather in ws_send, mark it so unawaited failures are not reported
+        reply.add_done_callback(done)
+        return reply
 
+    def ws_reply_timeout(self, request):
+        '''Fail the reply to a request that has been sent if it does not arrive within ws_request_timeout seconds'''
+        if request['id'] not in self.ws_requests:
+            return
+        entry = self.ws_requests[request['id']]
+        reply = entry['response']
+        entry['timeout'] = asyncio.get_running_loop().call_later(self.ws_request_timeout, lambda: reply.done() or reply.set_exception(asyncio.TimeoutError(f"No reply to websocket request {request}")))
 
+    def ws_reply(self, message):
+        reply = self.ws_requests[message['id']]['response']
+        if reply.done():
+            return
+        if 'error' in message:
+            reply.set_exception(WebsocketRequestError(self.ws_requests[message['id']]['data'], message['error']))
+        else:
+            reply.set_result(message.get('result'))
 
+    async def ws_send_paced(self, connection, request):
+        '''Send a request on a connection once fewer than max_ws_messages_per_second have been sent on it in the last second'''
+        async with connection.send_lock:
+            if len(connection.send_times) == connection.send_times.maxlen:
+                wait = connection.send_times[0] + 1 - time.monotonic()
+                if wait > 0:
+                    await asyncio.sleep(wait)
+            await connection.client.send(json.dumps(request))
+            connection.send_times.append(time.monotonic())
+
+
+
+
+    async def send_request(self, method, endpoint, params, headers, send, priority_class = None):
+        '''Send a rest request once the scheduler and rate limiter allow it, send is called with the url and request extensions and returns the response'''
+        if priority_class is None:
+            priority_class = request_class(method, endpoint, headers)
+        async with self.scheduler.slot(priority_class):
+            if self.rate_limiter is not None:
+                await self.rate_limiter.acquire(method, endpoint, params, PRIORITIES[priority_class])
+            trace = RequestTrace()
+            response = await send(self.base_endpoint + endpoint, {'trace': trace})
+            self.connection_stats.record(endpoint, trace)
+            if self.rate_limiter is not None:
+                self.rate_limiter.update(response.headers, response.status_code)
+        return response
+
+    def set_rate_limits(self, rate_limits, **options):
+        '''Hold back rest requests to stay within the rateLimits from exchangeInfo, options are passed to RateLimiter'''
+        self.rate_limiter = RateLimiter(rate_limits, **options)
+
+    @staticmethod
+    def request_key(endpoint, params, headers):
+        '''Identifies identical requests, ignoring the signature and timestamp of signed requests'''
+        params = tuple(sorted((k, str(v)) for k, v in params.items() if k not in ('timestamp', 'signature', 'recvWindow')))
+        return endpoint, params, headers.get('X-MBX-APIKEY')
+
+    def set_cache_ttl(self, endpoint, ttl):
+        '''Keep rest_get responses from endpoint for ttl seconds, None to stop caching it'''
+        if ttl is None:
+            self.cache_ttls.pop(endpoint, None)
+            self.invalidate(endpoint)
+        else:
+            self.cache_ttls[endpoint] = ttl
+
+    def invalidate(self, endpoint = None):
+        '''Drop the cached responses of endpoint, or of every endpoint if None, later requests do not share requests already in flight'''
+        self.cache_generation += 1
+        if endpoint is None:
+            self.cache = {}
+            self.in_flight = {}
+        else:
+            self.cache = {key: value for key, value in self.cache.items() if key[0] != endpoint}
+            self.in_flight = {key: task for key, task in self.in_flight.items() if key[0] != endpoint}
 
     async def rest_get(self, endpoint: str, **kwargs):
-        '''Send a get request to the rest api and returns the response. Raises httpx.HTTPStatusError if the respons status is not 200'''
+        '''Send a get request to the rest api and returns the response. Raises httpx.HTTPStatusError if the respons status is not 200
+            Concurrent identical requests share a single request, and responses from endpoints with a cache ttl are
+            reused until they expire or are invalidated. Each caller gets its own copy of the response'''
         params = {} if 'params' not in kwargs else kwargs['params']
         headers = {} if 'headers' not in kwargs else kwargs['headers']
-        response =  await self.httpx_client.get(self.base_endpoint + endpoint, headers=headers, params=params) 
+        key = self.request_key(endpoint, params, headers)
+        ttl = self.cache_ttls.get(endpoint)
+        if ttl is not None and key in self.cache:
+            expiry, text = self.cache[key]
+            if expiry > time.monotonic():
+                return json.loads(text)
+            del self.cache[key]
+        if key not in self.in_flight:
+            task = asyncio.create_task(self.send_get(endpoint, params, headers, kwargs.get('request_class')))
+            self.in_flight[key] = task
+            task.add_done_callback(lambda t: self.in_flight.pop(key) if self.in_flight.get(key) is t else None)
+        else:
+            task = self.in_flight[key]
+        generation = self.cache_generation
+        text = await asyncio.shield(task)
+        if text is None:
+            return None
+        if ttl is not None and generation == self.cache_generation:
+            self.cache[key] = (time.monotonic() + ttl, text)
+        return json.loads(text)
+
+    async def send_get(self, endpoint, params, headers, priority_class = None):
+        response = await self.send_request('GET', endpoint, params, headers, lambda url, extensions: self.httpx_client.get(url, headers=headers, params=params, extensions=extensions), priority_class)
         
         try:
             response.raise_for_status()
@@ -90,7 +542,7 @@ class ConnectionManager:
             print(e, response.text)
             raise e
         if endpoint != '':
-            return json.loads(response.text)
+            return response.text
     
 
     async def rest_post(self, endpoint: str, **kwargs): 
@@ -98,7 +550,7 @@ class ConnectionManager:
         params = None if 'params' not in kwargs else kwargs['params']
         headers = None if 'headers' not in kwargs else kwargs['headers']
         
-        response =  await self.httpx_client.post(self.base_endpoint + endpoint, params=params, headers = headers)   
+        response = await self.send_request('POST', endpoint, params, headers, lambda url, extensions: self.httpx_client.post(url, params=params, headers = headers, extensions=extensions), kwargs.get('request_class'))
         response.request.read()
         try:
             response.raise_for_status()
@@ -115,7 +567,7 @@ class ConnectionManager:
         params = {} if 'params' not in kwargs else kwargs['params']
         headers = {} if 'headers' not in kwargs else kwargs['headers']
         
-        response =  await self.httpx_client.put(self.base_endpoint + endpoint, data=params, headers = headers)   
+        response = await self.send_request('PUT', endpoint, params, headers, lambda url, extensions: self.httpx_client.put(url, data=params, headers = headers, extensions=extensions), kwargs.get('request_class'))
         response.request.read()
         try:
             response.raise_for_status()
@@ -132,7 +584,7 @@ class ConnectionManager:
     async def rest_delete(self, endpoint: str, **kwargs):
         headers = kwargs['headers'] if 'headers' in kwargs else {}
         params = kwargs['params'] if 'params' in kwargs else {}
-        response = await self.httpx_client.delete(self.base_endpoint + endpoint, params=params,headers=headers)
+        response = await self.send_request('DELETE', endpoint, params, headers, lambda url, extensions: self.httpx_client.delete(url, params=params,headers=headers, extensions=extensions), kwargs.get('request_class'))
         try:
             response.raise_for_status()
         except Exception as e:
@@ -0,0 +1,99 @@
+'''Websocket frame decoders
+
+A decoder turns each raw websocket frame into the message put on ConnectionManager.ws_q.
+orjson or msgspec are used when they are installed, falling back to the standard library
+json module. With msgspec, depth, trade and futures bookTicker payloads can also be decoded
+straight into typed structs that support the same message['field'] access as the dicts.
+'''
+import json
+from typing import List, Optional, Tuple, Union
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+
+if msgspec is not None:
+    class Payload(msgspec.Struct, tag_field='e'):
+        def __getitem__(self, key):
+            return getattr(self, key)
+
+        def __contains__(self, key):
+            return key in self.__struct_fields__
+
+    class DepthUpdate(Payload, tag='depthUpdate'):
+        E: int
+        s: str
+        U: int
+        u: int
+        b: List[Tuple[float, float]]
+        a: List[Tuple[float, float]]
+        T: Optional[int] = None
+        pu: Optional[int] = None
+
+    class TradeUpdate(Payload, tag='trade'):
+        E: int
+        s: str
+        t: int
+        p: float
+        q: float
+        T: int
+        m: bool
+
+    class BookTickerUpdate(Payload, tag='bookTicker'):
+        s: str
+        b: float
+        B: float
+        a: float
+        A: float
+        E: int = 0
+        T: int = 0
+        u: int = 0
+
+    class Envelope(msgspec.Struct):
+        stream: str
+        data: Union[DepthUpdate, TradeUpdate, BookTickerUpdate]
+
+
+class TypedDecoder:
+    """
+        Decode combined stream frames into {'stream': name, 'data': struct} for the payloads with a struct,
+        and into dicts for all other frames. Price and volume strings are decoded into floats.
+    """
+    def __init__(self):
+        if msgspec is None:
+            raise ImportError('TypedDecoder requires msgspec')
+        self.typed = msgspec.json.Decoder(Envelope, strict=False)
+        self.generic = msgspec.json.Decoder()
+
+    def __call__(self, frame):
+        try:
+            envelope = self.typed.decode(frame)
+        except msgspec.ValidationError:
+            return self.generic.decode(frame)
+        return {'stream': envelope.stream, 'data': envelope.data}
+
+
+def get_decoder(name=None, typed=False):
+    """
+        Returns a websocket frame decoder
+            name: 'orjson', 'msgspec' or 'json'. If None the fastest installed library is used
+            typed: decode depth, trade and bookTicker payloads into structs, requires msgspec
+    """
+    if typed:
+        return TypedDecoder()
+    if name is None:
+        name = 'orjson' if orjson is not None else 'msgspec' if msgspec is not None else 'json'
+    if name == 'orjson':
+        return orjson.loads
+    if name == 'msgspec':
+        return msgspec.json.Decoder().decode
+    if name == 'json':
+        return json.loads
+    raise ValueError(f'Unknown decoder {name}')
@@ -0,0 +1,99 @@
+'''HTTP connection pool settings and per request connection reuse and timing statistics'''
+import time
+from collections import deque
+import httpx
+
+try:
+    import h2
+except ImportError:
+    h2 = None
+
+#keep idle connections open for longer than the httpx default of 5 seconds, so that an order sent after
+#a quiet period does not pay for a new TCP and TLS handshake
+DEFAULT_LIMITS = {'max_connections': 20, 'max_keepalive_connections': 10, 'keepalive_expiry': 120}
+
+
+def create_client(limits=None, http2=False, timeout=10):
+    """
+        Returns an httpx.AsyncClient with a tuned connection pool
+            limits: {'max_connections', 'max_keepalive_connections', 'keepalive_expiry'} updating DEFAULT_LIMITS
+            http2: multiplex requests over HTTP/2 connections, requires the h2 package (pip install httpx[http2])
+            timeout: request timeout in seconds
+    """
+    pool_limits = dict(DEFAULT_LIMITS)
+    if limits is not None:
+        pool_limits.update(limits)
+    if http2 and h2 is None:
+        print('h2 is not installed, using HTTP/1.1')
+        http2 = False
+    return httpx.AsyncClient(limits=httpx.Limits(**pool_limits), http2=http2, timeout=timeout)
+
+
+class RequestTrace:
+    """
+        httpx trace extension recording whether a request opened a new connection and when each stage finished
+    """
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.new_connection = False
+        self.events = {}
+
+    async def __call__(self, event_name, info):
+        if event_name.startswith('connection.connect_tcp'):
+            self.new_connection = True
+        self.events[event_name] = time.perf_counter()
+
+    def connect_time(self):
+        '''Seconds spent on the TCP and TLS handshakes, 0 for a reused connection'''
+        if not self.new_connection:
+            return 0.0
+        end = self.events.get('connection.start_tls.complete', self.events.get('connection.connect_tcp.complete', self.start))
+        return end - self.events.get('connection.connect_tcp.started', self.start)
+
+    def response_time(self):
+        '''Seconds from sending the request headers to receiving the response headers'''
+        for version in ('http11', 'http2'):
+            sent = self.events.get(f'{version}.send_request_headers.started')
+            received = self.events.get(f'{version}.receive_response_headers.complete')
+            if sent is not None and received is not None:
+                return received - sent
+        return 0.0
+
+
+class ConnectionStats:
+    """
+        Connection reuse and timings of the recent requests to each endpoint
+    """
+    def __init__(self, history=1000):
+        self.requests = 0
+        self.new_connections = 0
+        self.history = history
+        self.endpoints = {} #{endpoint: deque of (reused, connect time, response time, total time)}
+
+    def record(self, endpoint, trace):
+        total = time.perf_counter() - trace.start
+        self.requests += 1
+        self.new_connections += trace.new_connection
+        if endpoint not in self.endpoints:
+            self.endpoints[endpoint] = deque(maxlen=self.history)
+        self.endpoints[endpoint].append((not trace.new_connection, trace.connect_time(), trace.response_time(), total))
+
+    def summary(self):
+        """
+            Returns {'requests', 'reused', 'endpoints': {endpoint: {'requests', 'reused', 'mean_connect_time',
+            'mean_response_time', 'mean_time', 'max_time'}}} with reused the fraction of requests sent on an
+            existing connection and the times in seconds over the recent requests to the endpoint
+        """
+        endpoints = {}
+        for endpoint, records in self.endpoints.items():
+            n = len(records)
+            endpoints[endpoint] = {
+                'requests': n,
+                'reused': sum(r[0] for r in records) / n,
+                'mean_connect_time': sum(r[1] for r in records) / n,
+                'mean_response_time': sum(r[2] for r in records) / n,
+                'mean_time': sum(r[3] for r in records) / n,
+                'max_time': max(r[3] for r in records),
+            }
+        reused = 1 - self.new_connections / self.requests if self.requests else 0.0
+        return {'requests': self.requests, 'reused': reused, 'endpoints': endpoints}
@@ -0,0 +1,157 @@
+'''Client side REST rate limiting
+
+A RateLimiter keeps a token bucket for each of the exchangeInfo rateLimits. Before each request it
+takes the weight of the endpoint from the REQUEST_WEIGHT buckets and one order from the ORDERS buckets
+for order placement, waiting in turn if there are not enough. The used weight and order counts reported
+in the X-MBX-USED-WEIGHT-* and X-MBX-ORDER-COUNT-* response headers are used to correct the buckets,
+and a 429 or 418 response pauses all requests for the Retry-After period.
+'''
+import asyncio, re, time
+from .scheduling import PriorityLock
+
+INTERVALS = {'SECOND': 'S', 'MINUTE': 'M', 'HOUR': 'H', 'DAY': 'D'}
+INTERVAL_SECONDS = {'S': 1, 'M': 60, 'H': 60 * 60, 'D': 24 * 60 * 60}
+USAGE_HEADER = re.compile(r'x-mbx-(used-weight|order-count)-(\d+)([smhd])$')
+
+
+def limit_weight(limits, default=100):
+    '''Weight of a request as a function of its limit param, limits is [(max limit, weight), ...]'''
+    def weight(params):
+        limit = int(params.get('limit', default))
+        for max_limit, w in limits:
+            if limit <= max_limit:
+                return w
+        return limits[-1][1]
+    return weight
+
+
+#(method, endpoint): weight or function of the request params, everything else has weight 1
+ENDPOINT_WEIGHTS = {
+    ('GET', '/api/v3/exchangeInfo'): 20,
+    ('GET', '/api/v3/depth'): limit_weight([(100, 5), (500, 25), (1000, 50), (5000, 250)]),
+    ('GET', '/api/v3/klines'): 2,
+    ('GET', '/api/v3/ticker/price'): lambda params: 2 if 'symbol' in params else 4,
+    ('GET', '/api/v3/ticker/24hr'): lambda params: 2 if 'symbol' in params else 80,
+    ('GET', '/api/v3/account'): 20,
+    ('GET', '/api/v3/order'): 4,
+    ('GET', '/api/v3/openOrders'): lambda params: 6 if 'symbol' in params else 80,
+    ('GET', '/api/v3/allOrders'): 20,
+    ('GET', '/api/v3/myTrades'): 20,
+    ('DELETE', '/api/v3/openOrders'): 1,
+    ('POST', '/api/v3/userDataStream'): 2,
+    ('PUT', '/api/v3/userDataStream'): 2,
+    ('GET', '/fapi/v1/exchangeInfo'): 1,
+    ('GET', '/fapi/v1/depth'): limit_weight([(50, 2), (100, 5), (500, 10), (1000, 20)], default=500),
+    ('GET', '/fapi/v1/klines'): limit_weight([(99, 1), (499, 2), (1000, 5), (1500, 10)], default=500),
+    ('GET', '/fapi/v2/account'): 5,
+    ('GET', '/fapi/v2/balance'): 5,
+    ('GET', '/fapi/v2/positionRisk'): 5,
+    ('GET', '/fapi/v1/openOrders'): lambda params: 1 if 'symbol' in params else 40,
+    ('GET', '/fapi/v1/userTrades'): 5,
+}
+
+#requests that count towards the ORDERS limits
+ORDER_ENDPOINTS = {('POST', '/api/v3/order'), ('POST', '/api/v3/order/oco'), ('POST', '/api/v3/order/cancelReplace'), ('POST', '/fapi/v1/order'), ('POST', '/fapi/v1/batchOrders')}
+
+
+class TokenBucket:
+    def __init__(self, limit, interval):
+        """
+            limit: tokens available per interval seconds
+        """
+        self.limit = limit
+        self.interval = interval
+        self.tokens = limit
+        self.updated = time.monotonic()
+
+    def refill(self, now):
+        self.tokens = min(self.limit, self.tokens + (now - self.updated) * self.limit / self.interval)
+        self.updated = now
+
+    def wait_time(self, n):
+        '''Seconds until n tokens are available'''
+        return max(0, (n - self.tokens) * self.interval / self.limit)
+
+    def sync(self, used, now):
+        '''Correct the bucket with the usage reported by the exchange, never adding tokens'''
+        self.refill(now)
+        self.tokens = min(self.tokens, self.limit - used)
+
+
+class RateLimiter:
+    """
+        Token buckets for the REQUEST_WEIGHT and ORDERS rate limits of an exchange
+    """
+    def __init__(self, rate_limits, weights=ENDPOINT_WEIGHTS, order_endpoints=ORDER_ENDPOINTS, margin=0.9):
+        """
+            rate_limits: the rateLimits list from exchangeInfo
+            weights: {(method, endpoint): weight or function of params}
+            order_endpoints: set of (method, endpoint) that place orders
+            margin: fraction of each limit to use, leaving room for requests the buckets do not know about
+        """
+        self.weights = weights
+        self.order_endpoints = order_endpoints
+        self.buckets = {'used-weight': {}, 'order-count': {}} #{kind: {'1M': TokenBucket}}
+        for rate_limit in rate_limits:
+            kind = {'REQUEST_WEIGHT': 'used-weight', 'ORDERS': 'order-count'}.get(rate_limit['rateLimitType'])
+            if kind is None:
+                continue
+            key = f"{rate_limit['intervalNum']}{INTERVALS[rate_limit['interval']]}"
+            self.buckets[kind][key] = TokenBucket(rate_limit['limit'] * margin, rate_limit['intervalNum'] * INTERVAL_SECONDS[key[-1]])
+        self.lock = PriorityLock()
+        self.blocked_until = 0
+        self.waiting = 0
+        self.wait_time = 0 #total seconds requests have been held back
+
+    def weight(self, method, endpoint, params=None):
+        weight = self.weights.get((method, endpoint), 1)
+        if callable(weight):
+            weight = weight({} if params is None else params)
+        return weight
+
+    async def acquire(self, method, endpoint, params=None, priority=0):
+        '''Wait until there is enough weight, and order count for orders, to send a request, lower priority values go first'''
+        costs = [(bucket, self.weight(method, endpoint, params)) for bucket in self.buckets['used-weight'].values()]
+        if (method, endpoint) in self.order_endpoints:
+            costs += [(bucket, 1) for bucket in self.buckets['order-count'].values()]
+        start = time.monotonic()
+        self.waiting += 1
+        try:
+            async with self.lock.hold(priority):
+                while True:
+                    now = time.monotonic()
+                    for bucket, n in costs:
+                        bucket.refill(now)
+                    wait = max([self.blocked_until - now] + [bucket.wait_time(min(n, bucket.limit)) for bucket, n in costs])
+                    if wait <= 0:
+                        break
+                    await asyncio.sleep(wait)
+                for bucket, n in costs:
+                    bucket.tokens -= n
+        finally:
+            self.waiting -= 1
+            self.wait_time += time.monotonic() - start
+
+    def update(self, headers, status_code=200):
+        '''Sync the buckets with the usage headers of a response, and back off after a 429 or 418'''
+        now = time.monotonic()
+        for name, value in headers.items():
+            match = USAGE_HEADER.match(name.lower())
+            if match is None:
+                continue
+            kind, key = match.group(1), match.group(2) + match.group(3).upper()
+            if key in self.buckets[kind]:
+                self.buckets[kind][key].sync(float(value), now)
+        if status_code in (418, 429):
+            retry_after = headers.get('Retry-After')
+            self.blocked_until = max(self.blocked_until, now + (float(retry_after) if retry_after is not None else 60))
+
+    def usage(self):
+        '''Returns {kind: {interval: fraction of the limit used}}'''
+        now = time.monotonic()
+        usage = {}
+        for kind, buckets in self.buckets.items():
+            for key, bucket in buckets.items():
+                bucket.refill(now)
+                usage.setdefault(kind, {})[key] = 1 - bucket.tokens / bucket.limit
+        return usage
@@ -0,0 +1,155 @@
+'''Prioritised scheduling of REST requests
+
+Requests are split into classes, order placement and cancellation first, then account queries, then
+market data. A RequestScheduler caps the number of requests in flight, overall and per class, and when
+a slot frees up it goes to the waiting request of the highest priority class that has room. So a burst
+of order book snapshots or candles can not hold up an order.
+'''
+import asyncio, heapq, time
+from collections import deque
+from contextlib import asynccontextmanager
+
+PRIORITIES = {'order': 0, 'account': 1, 'market_data': 2}
+
+#requests that place, replace or cancel orders
+ORDER_REQUESTS = {
+    ('POST', '/api/v3/order'), ('DELETE', '/api/v3/order'), ('DELETE', '/api/v3/openOrders'),
+    ('POST', '/api/v3/order/oco'), ('POST', '/api/v3/order/cancelReplace'),
+    ('POST', '/fapi/v1/order'), ('DELETE', '/fapi/v1/order'), ('PUT', '/fapi/v1/order'),
+    ('POST', '/fapi/v1/batchOrders'), ('DELETE', '/fapi/v1/batchOrders'), ('DELETE', '/fapi/v1/allOpenOrders'),
+}
+
+
+def request_class(method, endpoint, headers=None):
+    '''order for order entry, account for other requests with an api key and market_data for the rest'''
+    if (method, endpoint) in ORDER_REQUESTS:
+        return 'order'
+    if headers is not None and 'X-MBX-APIKEY' in headers:
+        return 'account'
+    return 'market_data'
+
+
+class PriorityLock:
+    """
+        asyncio lock handed to the waiter with the lowest priority value, in arrival order within a priority
+    """
+    def __init__(self):
+        self.locked = False
+        self.waiters = []
+        self.count = 0
+
+    async def acquire(self, priority=0):
+        if not self.locked and len(self.waiters) == 0:
+            self.locked = True
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self.waiters, (priority, self.count, future))
+        self.count += 1
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self.release()
+            raise
+
+    def release(self):
+        while len(self.waiters):
+            _, _, future = heapq.heappop(self.waiters)
+            if not future.done():
+                future.set_result(None)
+                return
+        self.locked = False
+
+    @asynccontextmanager
+    async def hold(self, priority=0):
+        await self.acquire(priority)
+        try:
+            yield
+        finally:
+            self.release()
+
+
+class RequestScheduler:
+    """
+        Caps the REST requests in flight and hands free slots to the highest priority class first
+    """
+    def __init__(self, max_concurrency=10, class_concurrency=None, history=1000):
+        """
+            max_concurrency: requests in flight across all classes
+            class_concurrency: {class: cap} updating the defaults of no cap for orders and 4 for account
+                and market data requests, None for no cap
+            history: number of queue times kept per class for the metrics
+        """
+        self.max_concurrency = max_concurrency
+        self.class_concurrency = {'order': None, 'account': 4, 'market_data': 4}
+        if class_concurrency is not None:
+            self.class_concurrency.update(class_concurrency)
+        self.active = {c: 0 for c in PRIORITIES}
+        self.waiters = [] #heap of (priority, count, class, future)
+        self.count = 0
+        self.requests = {c: 0 for c in PRIORITIES}
+        self.queue_times = {c: deque(maxlen=history) for c in PRIORITIES}
+
+    def has_room(self, request_class):
+        cap = self.class_concurrency[request_class]
+        return sum(self.active.values()) < self.max_concurrency and (cap is None or self.active[request_class] < cap)
+
+    async def acquire(self, request_class):
+        start = time.monotonic()
+        priority = PRIORITIES[request_class]
+        if self.has_room(request_class) and not any(p <= priority for p, _, _, _ in self.waiters):
+            self.active[request_class] += 1
+        else:
+            future = asyncio.get_running_loop().create_future()
+            heapq.heappush(self.waiters, (priority, self.count, request_class, future))
+            self.count += 1
+            try:
+                await future
+            except asyncio.CancelledError:
+                if future.done() and not future.cancelled():
+                    self.release(request_class)
+                raise
+        self.requests[request_class] += 1
+        self.queue_times[request_class].append(time.monotonic() - start)
+
+    def release(self, request_class):
+        self.active[request_class] -= 1
+        waiting = []
+        while len(self.waiters):
+            waiter = heapq.heappop(self.waiters)
+            _, _, waiter_class, future = waiter
+            if future.done():
+                continue
+            if self.has_room(waiter_class):
+                self.active[waiter_class] += 1
+                future.set_result(None)
+            else:
+                waiting.append(waiter)
+        for waiter in waiting:
+            heapq.heappush(self.waiters, waiter)
+
+    @asynccontextmanager
+    async def slot(self, request_class):
+        await self.acquire(request_class)
+        try:
+            yield
+        finally:
+            self.release(request_class)
+
+    def metrics(self):
+        """
+            Returns {class: {'requests', 'active', 'waiting', 'mean_queue_time', 'p99_queue_time', 'max_queue_time'}}
+            with the queue times in seconds over the last history requests of the class
+        """
+        metrics = {}
+        for c in PRIORITIES:
+            times = sorted(self.queue_times[c])
+            metrics[c] = {
+                'requests': self.requests[c],
+                'active': self.active[c],
+                'waiting': sum(1 for _, _, waiter_class, future in self.waiters if waiter_class == c and not future.done()),
+                'mean_queue_time': sum(times) / len(times) if len(times) else 0.0,
+                'p99_queue_time': times[int(0.99 * (len(times) - 1))] if len(times) else 0.0,
+                'max_queue_time': times[-1] if len(times) else 0.0,
+            }
+        return metrics
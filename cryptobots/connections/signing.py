@@ -0,0 +1,92 @@
+'''Request signing and server clock synchronisation
+
+Signed requests are rejected with -1021 when their timestamp is more than recvWindow away from the
+server's clock. A ServerClock keeps an estimate of the offset between the server and local clocks from
+timed requests to the exchange's time endpoint, taking the sample with the shortest round trip, and
+stamps requests with the estimated server time. A Signer keeps the HMAC state keyed with a secret so that
+each signature only copies it rather than hashing the key again.
+'''
+import asyncio, hashlib, hmac, time
+from collections import deque
+
+
+class ServerClock:
+    """
+        Offset of the exchange clock from the local clock, estimated from timed requests to a time endpoint
+    """
+    def __init__(self, connection_manager=None, endpoint=None, samples=5, history=20):
+        """
+            connection_manager, endpoint: where to request the server time from, eg /api/v3/time
+            samples: number of requests made by each sync
+            history: number of recent samples the estimate is taken from
+        """
+        self.connection_manager = connection_manager
+        self.endpoint = endpoint
+        self.samples = samples
+        self.offset = 0 #milliseconds to add to the local time
+        self.round_trip = None #milliseconds, of the sample the offset is from
+        self.history = deque(maxlen=history) #(round trip, offset)
+        self.sync_task = None
+
+    def add_sample(self, server_time, sent, received):
+        """
+            Add a server time in milliseconds received in reply to a request sent and received at the local times
+            in seconds. The server time is assumed to be from the middle of the round trip, so the sample with the
+            shortest round trip has the smallest error.
+        """
+        round_trip = (received - sent) * 1000
+        self.history.append((round_trip, server_time - (sent + received) * 500))
+        self.round_trip, self.offset = min(self.history)
+
+    def now(self):
+        '''Estimated server time in milliseconds'''
+        return int(time.time() * 1000 + self.offset)
+
+    async def sync(self):
+        for _ in range(self.samples):
+            sent = time.time()
+            response = await self.connection_manager.rest_get(self.endpoint)
+            self.add_sample(response['serverTime'], sent, time.time())
+
+    def start(self, interval=60):
+        '''Resync every interval seconds in the background'''
+        self.sync_task = asyncio.create_task(self.sync_periodically(interval))
+
+    async def sync_periodically(self, interval):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.sync()
+            except Exception as e:
+                print('Error synchronising clock', e)
+
+    async def stop(self):
+        if self.sync_task is not None:
+            self.sync_task.cancel()
+            try:
+                await self.sync_task
+            except asyncio.CancelledError:
+                pass
+            self.sync_task = None
+
+
+class Signer:
+    """
+        HMAC SHA256 signatures with one secret key
+    """
+    def __init__(self, secret_key):
+        self.keyed = hmac.new(secret_key.encode('utf-8'), digestmod=hashlib.sha256)
+
+    def signature(self, payload):
+        signature = self.keyed.copy()
+        signature.update(payload.encode('utf-8'))
+        return signature.hexdigest()
+
+
+signers = {} #{secret key: Signer}
+
+def get_signer(secret_key):
+    '''Returns the Signer for secret_key, shared by every exchange using it'''
+    if secret_key not in signers:
+        signers[secret_key] = Signer(secret_key)
+    return signers[secret_key]
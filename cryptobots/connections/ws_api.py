@@ -0,0 +1,132 @@
+'''Requests over the Binance websocket API
+
+A WebsocketAPI keeps one websocket open to the trading API and matches each reply to its request by id,
+so orders avoid the overhead of a new HTTP request. Requests are signed with HMAC keys per request, the
+same way as the REST API, with the params sorted by name, see Exchange.sign_ws_params.
+'''
+import asyncio, json, random, time
+from collections import deque
+from contextlib import suppress
+import websockets
+from .connections import WebsocketRequestError
+from .decoders import get_decoder
+
+
+class WebsocketAPI:
+    """
+        Persistent connection to a websocket API with request and response correlation
+    """
+    def __init__(self, uri, decoder=None, request_timeout=5, reconnect_delay=0.5, max_reconnect_delay=30, history=1000):
+        """
+            uri: websocket API endpoint, eg wss://ws-api.binance.com:443/ws-api/v3
+            request_timeout: seconds to wait for a reply
+            reconnect_delay, max_reconnect_delay: bounds of the jittered exponential backoff between attempts
+                to reopen a dropped connection
+            history: number of round trip times kept for each method, see latency
+        """
+        self.uri = uri
+        self.decoder = get_decoder() if decoder is None else decoder
+        self.request_timeout = request_timeout
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+        self.client = None
+        self.listener = None
+        self.reconnect_task = None
+        self.open = False
+        self.closing = False
+        self.id = 0
+        self.requests = {} #{id: future}
+        self.history = history
+        self.round_trips = {} #{method: deque of seconds}
+        self.rate_limits = [] #from the last reply that included them
+
+    async def connect(self):
+        '''Open the connection, returns False and keeps retrying in the background if it fails'''
+        self.closing = False
+        try:
+            await self.open_connection()
+            return True
+        except Exception as e:
+            print('Error connecting to websocket API', e)
+            self.reconnect()
+            return False
+
+    async def open_connection(self):
+        self.client = await websockets.connect(self.uri, ssl=True, compression=None)
+        self.open = True
+        self.listener = asyncio.create_task(self.listen())
+
+    def reconnect(self):
+        if not self.closing and (self.reconnect_task is None or self.reconnect_task.done()):
+            self.reconnect_task = asyncio.create_task(self.reconnect_with_backoff())
+
+    async def reconnect_with_backoff(self):
+        delay = self.reconnect_delay
+        while not self.closing:
+            await asyncio.sleep(random.uniform(delay / 2, delay))
+            try:
+                await self.open_connection()
+                return
+            except Exception as e:
+                print('Error reconnecting to websocket API', e)
+                delay = min(delay * 2, self.max_reconnect_delay)
+
+    async def close(self):
+        self.closing = True
+        self.open = False
+        if self.reconnect_task is not None:
+            self.reconnect_task.cancel()
+            with suppress(asyncio.CancelledError):
+                await self.reconnect_task
+        if self.client is not None:
+            await self.client.close()
+            await self.listener
+
+    async def listen(self):
+        try:
+            async for message in self.client:
+                message = self.decoder(message)
+                reply = self.requests.pop(message.get('id'), None)
+                if 'rateLimits' in message:
+                    self.rate_limits = message['rateLimits']
+                if reply is None or reply.done():
+                    continue
+                if message.get('status', 200) != 200 or 'error' in message:
+                    reply.set_exception(WebsocketRequestError(message.get('id'), message.get('error')))
+                else:
+                    reply.set_result(message['result'])
+        except Exception as e:
+            print('Error in WebsocketAPI.listen', e)
+        finally:
+            self.open = False
+            for reply in self.requests.values():
+                if not reply.done():
+                    reply.set_exception(ConnectionError('Websocket API connection closed'))
+            self.requests = {}
+            self.reconnect()
+
+    async def request(self, method, params=None):
+        '''Send a request and return the result of the reply, raises WebsocketRequestError if it is rejected'''
+        if not self.open:
+            raise ConnectionError('Websocket API not connected')
+        request_id = self.id
+        self.id += 1
+        reply = asyncio.get_running_loop().create_future()
+        self.requests[request_id] = reply
+        request = {'id': request_id, 'method': method}
+        if params is not None:
+            request['params'] = params
+        start = time.perf_counter()
+        try:
+            await self.client.send(json.dumps(request))
+            result = await asyncio.wait_for(reply, self.request_timeout)
+        finally:
+            self.requests.pop(request_id, None)
+        if method not in self.round_trips:
+            self.round_trips[method] = deque(maxlen=self.history)
+        self.round_trips[method].append(time.perf_counter() - start)
+        return result
+
+    def latency(self):
+        '''Returns {method: (mean, max) round trip seconds} over the recent requests'''
+        return {method: (sum(times) / len(times), max(times)) for method, times in self.round_trips.items() if len(times)}
@@ -1,14 +1,30 @@
-import asyncio, time, hashlib, hmac, urllib, json
+import asyncio, time, hashlib, hmac, urllib, json, os, struct, inspect, logging
 from abc import ABC, abstractmethod
-from .connections import ConnectionManager
+from .connections import ConnectionManager, WebsocketAPI, WebsocketRequestError, ServerClock, get_decoder, get_signer
+import uuid
+from decimal import Decimal, ROUND_FLOOR, ROUND_CEILING, ROUND_HALF_EVEN
 from contextlib import suppress
 import httpx
-from .orderbooks import OrderBook
+from .orderbooks import OrderBook, TickOrderBook
+from .market_data import MarketDataWorker
+
+ORDER_DOES_NOT_EXIST = -2013 #error code of order lookups for orders the exchange has no record of
+DEFAULT_RECV_WINDOW = 5000 #milliseconds signed requests are valid for when recv_window is not set
+
+logger = logging.getLogger(__name__)
 
 class OrderPlacementError(Exception):
     """
         Exception raised when orders fail
     """
+class OrderStateUnknown(OrderPlacementError):
+    """
+        Exception raised when an order got no reply and it can not be looked up, so it may or may not have been placed
+    """
+    def __init__(self, client_order_id):
+        self.client_order_id = client_order_id
+        super().__init__(f"Unknown state of order {client_order_id}")
+
 class OrderClosed(Exception):
     """
         Exception raised when Cancellations fail since already queued
@@ -57,6 +73,48 @@ class Order:
     def __str__(self):
         return f"Order {self.id}, {self.side} on {self.market.name}, {self.volume} at {self.price}"
 
+class Increment:
+    """
+        Integer fixed point representation of the prices or sizes of a market, as a number of its tick or lot
+        increments, eg Increment('0.01000000') for a tickSize of 0.01
+    """
+    def __init__(self, increment):
+        increment = Decimal(increment).normalize()
+        self.decimals = max(0, -increment.as_tuple().exponent)
+        self.scale = 10 ** self.decimals
+        self.step = int(increment * self.scale) #increment in units of 10 ** -decimals
+        self.increment = float(increment)
+        self.per_unit = self.scale / self.step #increments per unit of price or size
+
+    def parse(self, value):
+        '''Number of increments in a price or size from the exchange, a string or float on the increment grid'''
+        return round(float(value) * self.per_unit)
+
+    def to_increments(self, value, rounding=ROUND_HALF_EVEN):
+        '''Number of increments in value rounded with a decimal rounding mode, exact for any float or Decimal'''
+        if not isinstance(value, Decimal):
+            value = Decimal(repr(float(value)))
+        return int((value * self.scale / self.step).to_integral_value(rounding))
+
+    def floor(self, value):
+        return self.to_increments(value, ROUND_FLOOR)
+
+    def ceil(self, value):
+        return self.to_increments(value, ROUND_CEILING)
+
+    def to_float(self, n):
+        return n * self.step / self.scale
+
+    def format(self, n):
+        '''Decimal string of n increments, as sent in orders'''
+        units = n * self.step
+        if self.decimals == 0:
+            return str(units)
+        sign = '-' if units < 0 else ''
+        whole, fraction = divmod(abs(units), self.scale)
+        return f'{sign}{whole}.{fraction:0{self.decimals}d}'
+
+
 class SpotMarket:
     """
         Holds basic spot market info
@@ -110,27 +168,346 @@ class Exchange(ABC):
         pass
     
 
-    def __init__(self):
-        self.connection_manager = ConnectionManager(self.rest_endpoint, self.ws_endpoint) 
+    account_endpoints = [] #rest endpoints with responses that change when orders are placed or filled
+    ws_api_endpoint = None #websocket API for order entry, see ws_orders
+    order_endpoint = None #rest endpoint used for orders when the websocket API is unavailable
+    time_endpoint = None #rest endpoint returning the server time, used to timestamp signed requests
+
+    def __init__(self, decoder=None, typed_messages=False, connection_options=None, ws_orders=False, recv_window=None, clock_sync_interval=60, inline_books=False, fixed_point=False):
+        """
+            decoder: json library used to decode websocket frames, 'orjson', 'msgspec' or 'json',
+                defaults to the fastest installed
+            typed_messages: decode depth, trade and bookTicker messages into msgspec structs
+            connection_options: passed to the ConnectionManager, eg {'ws_connections': 4, 'max_message_rate': 500, 'rebalance_interval': 10}
+            ws_orders: place and cancel orders over the exchange's websocket API, falling back to REST while it is
+                not connected
+            recv_window: milliseconds after their timestamp that signed requests are valid for, the exchange
+                default of 5000 if None
+            clock_sync_interval: seconds between samples of the server clock used to timestamp signed requests,
+                None to only sample it on connecting
+            inline_books: apply depth updates to the order books as they are parsed in ws_parse, rather than
+                through a queue and task per book. Updates are still buffered until the snapshot arrives.
+            fixed_point: parse depth levels into integer ticks and lots of the market, see Increment, so the order
+                books are keyed by int and hold exact volumes. Book prices and volumes are then in ticks and lots,
+                convert them with market.tick.to_float and market.lot.to_float.
+        """
+        self.options = {'decoder': decoder, 'typed_messages': typed_messages, 'connection_options': connection_options, 'inline_books': inline_books, 'fixed_point': fixed_point}
+        self.inline_books = inline_books
+        self.fixed_point = fixed_point
+        connection_options = {} if connection_options is None else connection_options
+        self.connection_manager = ConnectionManager(self.rest_endpoint, self.ws_endpoint, get_decoder(decoder, typed_messages), **connection_options) 
         self.markets = {}
         self.order_books = {}
         self.order_book_queues = {}
         self.trade_queues = {}
         self.market_names = {}
+        self.stream_handlers = {} #{stream: (handler, target, is coroutine function)}, see add_stream_handler
         self.user_updates = asyncio.Queue()
         self.connection_lock = asyncio.Lock()
+        self.verification_task = None
+        self.market_data_workers = []
+        self.ws_api = WebsocketAPI(self.ws_api_endpoint, self.connection_manager.decoder) if ws_orders and self.ws_api_endpoint is not None else None
+        self.clock = ServerClock(self.connection_manager, self.time_endpoint)
+        self.recv_window = recv_window
+        self.clock_sync_interval = clock_sync_interval
 
     @abstractmethod
     async def connect(self):
         pass
 
+    def add_stream_handler(self, stream, handler, target=None):
+        """
+            Route the messages of a stream to handler(data, target), where target is the book, queue or market the
+            stream updates. Handlers that are plain functions are applied straight away in ws_parse, coroutine
+            functions are awaited.
+        """
+        self.stream_handlers[stream] = (handler, target, inspect.iscoroutinefunction(handler))
+
+    def remove_stream_handler(self, stream):
+        self.stream_handlers.pop(stream, None)
+
+    async def ws_parse(self):
+        """
+            Parse incomming websocket information, looking up the handler of each message by its exact stream name
+        """
+        stream_handlers = self.stream_handlers
+        ws_q = self.connection_manager.ws_q
+        while True:
+            #get message from queue
+            message = await ws_q.get()
+            try:
+                handler = stream_handlers.get(message.get('stream'))
+                if handler is None:
+                    continue
+                handler, target, is_coroutine = handler
+                if is_coroutine:
+                    await handler(message['data'], target)
+                else:
+                    handler(message['data'], target)
+            except Exception as e:
+                print('Error in ws parse', e)
+                print(message)
+                raise e
+
     @abstractmethod
-    async def subscribe_to_order_books(self, *markets):
+    async def subscribe_to_order_books(self, *markets, **book_options):
         pass    
 
+    @abstractmethod
+    async def get_order_book_snapshot(self, market):
+        pass
+
+    @abstractmethod
+    async def request_order_book_snapshot(self, market, limit=100):
+        pass
+
+    def create_order_book(self, market, tick_ladder=False, max_ticks=None, **options):
+        """
+            Create the order book and update queue for a market
+                tick_ladder: use the numpy TickOrderBook with the market price increment
+                max_ticks: drop levels more than max_ticks ticks from the touch, see also max_depth
+                options: passed to the order book constructor
+            With inline_books the book has no queue of its own and order_book_queues holds its InlineUpdates
+        """
+        if max_ticks is not None:
+            options['max_distance'] = max_ticks * (1 if self.fixed_point else self.markets[market].price_increment)
+        order_book_queue = None if self.inline_books else asyncio.Queue()
+        options.setdefault('resync', lambda: self.get_order_book_snapshot(market))
+        if tick_ladder:
+            self.order_books[market] = TickOrderBook(order_book_queue, 1 if self.fixed_point else self.markets[market].price_increment, **options)
+        else:
+            self.order_books[market] = OrderBook(order_book_queue, **options)
+        self.order_book_queues[market] = self.order_books[market].update_queue
+        return self.order_books[market]
+
+    def fixed_point_levels(self, market, levels):
+        '''[[ticks, lots]] of the [[price, volume]] depth levels of market'''
+        tick, lot = self.markets[market].tick, self.markets[market].lot
+        return [[tick.parse(p), lot.parse(v)] for p, v in levels]
+
+    def order_book_snapshot_path(self, market, snapshot_directory):
+        return os.path.join(snapshot_directory, f'{self.markets[market].name}.book')
+
+    def save_order_books(self, snapshot_directory):
+        """
+            Checkpoint the initialised order books to snapshot_directory, for subscribe_to_order_books(..., snapshot_directory=...) to warm start from
+        """
+        os.makedirs(snapshot_directory, exist_ok=True)
+        for market, book in self.order_books.items():
+            if book.initialised:
+                book.save(self.order_book_snapshot_path(market, snapshot_directory), self.fixed_point)
+
+    async def restore_order_book(self, market, snapshot_directory, timeout=5):
+        """
+            Warm start an order book from a checkpoint, falling back to a REST snapshot if there is no
+            checkpoint or no live update following on from it within timeout seconds
+        """
+        path = self.order_book_snapshot_path(market, snapshot_directory)
+        try:
+            snapshot = OrderBook.load_snapshot(path, self.fixed_point)
+        except (OSError, ValueError, struct.error):
+            return await self.get_order_book_snapshot(market)
+        await self.order_book_queues[market].put(snapshot)
+        try:
+            await asyncio.wait_for(self.order_books[market].initialised_event.wait(), timeout)
+        except asyncio.TimeoutError:
+            await self.get_order_book_snapshot(market)
+
+    def start_order_book_verification(self, interval=60, depth=20):
+        """
+            Compare one order book every interval seconds against a REST snapshot of its top depth levels
+            in the background, without pausing the streams. Books that have drifted are resynced and
+            book.correct holds the result of the last comparison, see check_order_books.
+        """
+        self.verification_task = asyncio.create_task(self.verify_order_books(interval, depth))
+
+    async def verify_order_books(self, interval, depth):
+        while True:
+            for market in list(self.order_books):
+                await asyncio.sleep(interval)
+                if market not in self.order_books:
+                    continue
+                try:
+                    await self.verify_order_book(market, depth)
+                except Exception as e:
+                    print('Error verifying order book', market, e)
+
+    async def verify_order_book(self, market, depth, timeout=5):
+        """
+            Compare an order book with a REST snapshot, resyncing it if it has drifted
+            Returns the result of OrderBook.verify_snapshot
+        """
+        book = self.order_books[market]
+        if not book.initialised:
+            return None
+        book.start_verification(depth)
+        try:
+            snapshot = await self.request_order_book_snapshot(market, depth)
+            while book.initialised and book.previous_time < snapshot['time']:
+                await asyncio.wait_for(book.update_event.wait(), timeout)
+            correct = book.verify_snapshot(snapshot) if book.initialised else None
+        finally:
+            book.stop_verification()
+        if correct is False:
+            book.resync_order_book()
+        return correct
+
+    async def sync_clock(self):
+        """
+            Sample the server clock so that signed requests are timestamped with the server time rather than the
+            local time, and keep resampling it every clock_sync_interval seconds
+        """
+        if self.time_endpoint is None:
+            return
+        try:
+            await self.clock.sync()
+        except Exception as e:
+            print('Error synchronising clock, using the local time', e)
+        if self.clock_sync_interval is not None:
+            self.clock.start(self.clock_sync_interval)
+
+    def sign_params(self, api_key, secret_key, **kwargs):
+        params = {} if 'params' not in kwargs else kwargs['params']
+        headers = {} if 'headers' not in kwargs else kwargs['headers']
+        params['timestamp'] = self.clock.now()
+        if self.recv_window is not None:
+            params['recvWindow'] = self.recv_window
+        params['signature'] = get_signer(secret_key).signature(urllib.parse.urlencode(params))
+
+        headers['X-MBX-APIKEY'] = api_key
+        return params, headers
+
+    def sign_ws_params(self, api_key, secret_key, params):
+        '''Params of a websocket API request, which are signed sorted by name and include the api key'''
+        params = dict(params)
+        params['apiKey'] = api_key
+        params['timestamp'] = self.clock.now()
+        if self.recv_window is not None:
+            params['recvWindow'] = self.recv_window
+        params['signature'] = get_signer(secret_key).signature(urllib.parse.urlencode(sorted(params.items())))
+        return params
+
+    def invalidate_account_cache(self):
+        """
+            Drop the cached responses of the account endpoints, called when orders are updated or filled
+        """
+        for endpoint in self.account_endpoints:
+            self.connection_manager.invalidate(endpoint)
+
+    async def place_order(self, api_key, secret_key, params):
+        """
+            Place an order over the websocket API if it is connected, otherwise over REST, and return the response.
+            An order that gets no reply over the websocket may still have been placed, or still be on its way, and
+            the exchange only rejects duplicate client order ids among open orders, so it is not simply sent again.
+            It is looked up by its client order id with backoff until its recvWindow has passed and the exchange can
+            no longer accept it. The order is returned as soon as the exchange has it, and sent over REST only if
+            the exchange still has no record of it then. Raises OrderStateUnknown if a lookup fails.
+        """
+        if self.ws_api is not None and self.ws_api.open:
+            params = {**params, 'newClientOrderId': params.get('newClientOrderId', uuid.uuid4().hex)}
+            signed = self.sign_ws_params(api_key, secret_key, params)
+            try:
+                return await self.ws_api.request('order.place', signed)
+            except WebsocketRequestError:
+                raise
+            except Exception as e:
+                logger.warning('Websocket order %s got no reply, looking it up: %r', params['newClientOrderId'], e)
+            expires = signed['timestamp'] + (DEFAULT_RECV_WINDOW if self.recv_window is None else self.recv_window)
+            order = await self.await_order(api_key, secret_key, params['symbol'], params['newClientOrderId'], expires)
+            if order is not None:
+                return order
+        return await self.signed_post(self.order_endpoint, api_key, secret_key, params=params)
+
+    async def await_order(self, api_key, secret_key, symbol, client_order_id, expires, delay=0.25):
+        """
+            Look up an order that may still be in flight until the server time passes expires, in milliseconds,
+            returns the order or None if the exchange has no record of it by then
+        """
+        while True:
+            order = await self.find_order(api_key, secret_key, symbol, client_order_id)
+            if order is not None:
+                return order
+            wait = (expires - self.clock.now()) / 1000
+            if wait < 0:
+                return None
+            await asyncio.sleep(min(delay, wait + 0.001))
+            delay *= 2
+
+    async def find_order(self, api_key, secret_key, symbol, client_order_id):
+        """
+            Returns the order with client_order_id over REST, None if the exchange has no record of it, and raises
+            OrderStateUnknown if it can not be looked up
+        """
+        try:
+            return await self.signed_get(self.order_endpoint, api_key, secret_key, params={'symbol': symbol, 'origClientOrderId': client_order_id})
+        except httpx.HTTPStatusError as e:
+            try:
+                code = e.response.json().get('code')
+            except ValueError:
+                code = None
+            if code == ORDER_DOES_NOT_EXIST:
+                return None
+            raise OrderStateUnknown(client_order_id) from e
+        except Exception as e:
+            raise OrderStateUnknown(client_order_id) from e
+
+    async def cancel(self, api_key, secret_key, params):
+        """
+            Cancel an order over the websocket API if it is connected, otherwise over REST, and return the response
+        """
+        if self.ws_api is not None and self.ws_api.open:
+            try:
+                return await self.ws_api.request('order.cancel', self.sign_ws_params(api_key, secret_key, params))
+            except WebsocketRequestError:
+                raise
+            except Exception as e:
+                print('Websocket cancel failed, falling back to REST', repr(e))
+        return await self.signed_delete(self.order_endpoint, api_key, secret_key, params=params)
+
+    def order_latency(self):
+        """
+            Returns {method: (mean, max) seconds} round trip times of the websocket API order requests
+        """
+        return {} if self.ws_api is None else self.ws_api.latency()
+
+    async def reconnect_websockets(self, resync_interval=0.1):
+        """
+            Reopen the websockets after they have dropped, replaying the active subscriptions including
+            user data streams, and resync the existing order books from new snapshots. Unlike reconnect the
+            markets and order books are kept and exchangeInfo is not downloaded again.
+                resync_interval: seconds between the snapshot requests of the books, which also wait for the
+                    request scheduler and rate limiter like other rest requests
+        """
+        async with self.connection_lock:
+            await self.connection_manager.reconnect()
+            for i, book in enumerate(self.order_books.values()):
+                book.resync_order_book(wait=i * resync_interval)
+
+    async def start_market_data_worker(self, *markets, capacity=2 ** 16, **book_options):
+        """
+            Run the order books of markets in a separate process with its own connections, so that
+            decoding and applying depth updates does not delay this event loop. Returns the started
+            MarketDataWorker, which reads the best prices and changed levels from shared memory.
+                capacity: number of changed levels kept in the shared ring buffer
+                book_options: passed to subscribe_to_order_books in the worker
+        """
+        worker = MarketDataWorker(type(self), markets, capacity, self.options, **book_options)
+        await worker.start()
+        self.market_data_workers.append(worker)
+        return worker
+
+    def order_book_memory(self):
+        """
+            Approximate bytes used by the levels of each order book, {market: bytes}
+        """
+        return {market: book.memory_usage() for market, book in self.order_books.items()}
+
     async def __aenter__(self):
         await self.connection_manager.connect()
         await self.connect()
+        await self.sync_clock()
+        if self.ws_api is not None:
+            await self.ws_api.connect()
         return self
 
 
@@ -143,9 +520,18 @@ class Exchange(ABC):
         await self.unsubscribe_from_order_books(*self.order_books)
         #end tasks
         self.parse_task.cancel()
+        if self.verification_task is not None:
+            self.verification_task.cancel()
+            with suppress(asyncio.CancelledError):
+                await self.verification_task
         
         with suppress(asyncio.CancelledError):
             await self.parse_task
+        for worker in self.market_data_workers:
+            await worker.close()
+        if self.ws_api is not None:
+            await self.ws_api.close()
+        await self.clock.stop()
             
         
         await self.connection_manager.close()
@@ -0,0 +1,269 @@
+'''Run the market data websockets and order books in a separate process
+
+The worker process owns the depth streams, decodes the frames and applies them to its order books,
+then publishes the best bid and ask of each market and every changed level into a SharedBookRing.
+The trading process reads the ring through numpy views of the shared memory, so depth traffic never
+runs on the event loop that places orders.
+'''
+import asyncio, multiprocessing, time
+from multiprocessing import shared_memory
+import numpy as np
+
+HEADER_DTYPE = np.dtype([('written', '<u8'), ('capacity', '<u8'), ('markets', '<u8'), ('closed', '<u8')])
+
+TOP_OF_BOOK_DTYPE = np.dtype([
+    ('seq', '<u8'), #odd while the row is being written
+    ('time', '<i8'),
+    ('bid', '<f8'), ('bid_volume', '<f8'),
+    ('ask', '<f8'), ('ask_volume', '<f8'),
+])
+
+LEVEL_DTYPE = np.dtype([
+    ('seq', '<u8'), #position of the record in the stream of levels + 1, written last
+    ('time', '<i8'),
+    ('market', '<u4'),
+    ('side', '<u4'), #BID or ASK, | SNAPSHOT for the first level of a snapshot, after which the market's book should be cleared
+    ('price', '<f8'),
+    ('volume', '<f8'),
+])
+
+BID, ASK, SNAPSHOT = 0, 1, 2
+
+
+class SharedBookRing:
+    """
+        Shared memory with a seqlocked top of book row per market and a ring buffer of changed levels,
+        written by one process and read by any number of others
+    """
+    def __init__(self, markets=None, capacity=2 ** 16, name=None):
+        """
+            markets: number of markets, when creating the ring
+            capacity: number of level records kept in the ring before the oldest are overwritten
+            name: name of an existing ring to attach to
+        """
+        if name is None:
+            size = HEADER_DTYPE.itemsize + markets * TOP_OF_BOOK_DTYPE.itemsize + capacity * LEVEL_DTYPE.itemsize
+            self.memory = shared_memory.SharedMemory(create=True, size=size)
+            self.owner = True
+        else:
+            self.memory = shared_memory.SharedMemory(name=name)
+            self.owner = False
+        self.name = self.memory.name
+        self.header = np.ndarray((1,), dtype=HEADER_DTYPE, buffer=self.memory.buf)[0]
+        if name is None:
+            self.header['written'] = 0
+            self.header['capacity'] = capacity
+            self.header['markets'] = markets
+            self.header['closed'] = 0
+        self.capacity = int(self.header['capacity'])
+        offset = HEADER_DTYPE.itemsize
+        self.top = np.ndarray((int(self.header['markets']),), dtype=TOP_OF_BOOK_DTYPE, buffer=self.memory.buf, offset=offset)
+        offset += self.top.nbytes
+        self.levels = np.ndarray((self.capacity,), dtype=LEVEL_DTYPE, buffer=self.memory.buf, offset=offset)
+        if name is None:
+            self.top[:] = 0
+            self.levels['seq'] = 0
+
+    def close(self):
+        """
+            Detach from the shared memory, the creator also frees it
+        """
+        del self.header, self.top, self.levels
+        self.memory.close()
+        if self.owner:
+            self.memory.unlink()
+
+    #writer
+    def write_top_of_book(self, market, time, bid, bid_volume, ask, ask_volume):
+        row = self.top[market:market + 1]
+        row['seq'] += 1
+        row['time'] = time
+        row['bid'], row['bid_volume'], row['ask'], row['ask_volume'] = bid, bid_volume, ask, ask_volume
+        row['seq'] += 1
+
+    def write_levels(self, market, side, levels, time):
+        """
+            Append the [price, volume] levels of one side of a market to the ring
+        """
+        levels = np.asarray(levels, dtype=float).reshape(-1, 2)
+        n = len(levels)
+        if n == 0:
+            return
+        if n > self.capacity:
+            levels = levels[-self.capacity:]
+            n = self.capacity
+        written = int(self.header['written'])
+        positions = np.arange(written, written + n, dtype=np.uint64)
+        slots = positions % self.capacity
+        records = self.levels
+        records['seq'][slots] = 0
+        records['time'][slots] = time
+        records['market'][slots] = market
+        records['side'][slots] = side & ~SNAPSHOT
+        records['price'][slots] = levels[:, 0]
+        records['volume'][slots] = levels[:, 1]
+        if side & SNAPSHOT:
+            records['side'][slots[0]] = side
+        records['seq'][slots] = positions + 1
+        self.header['written'] = written + n
+
+    #reader
+    def written(self):
+        return int(self.header['written'])
+
+    def closed(self):
+        return bool(self.header['closed'])
+
+    def top_of_book(self, market):
+        """
+            Returns (time, bid, bid volume, ask, ask volume) of a market, or None before the first update
+        """
+        row = self.top[market:market + 1]
+        while True:
+            seq = int(row['seq'][0])
+            if seq % 2:
+                continue
+            values = row[0].item()
+            if int(row['seq'][0]) == seq:
+                return None if seq == 0 else values[1:]
+
+    def read_levels(self, cursor):
+        """
+            Returns (views, cursor, dropped) where views are up to two numpy views of the level records
+            written since cursor, in order, the cursor to pass to the next call and the number of records
+            that were overwritten before they could be read. The views are not copied, so they must be
+            used before capacity more levels are written, see valid.
+        """
+        written = int(self.header['written'])
+        dropped = 0
+        if written - cursor > self.capacity:
+            dropped = written - self.capacity - cursor
+            cursor = written - self.capacity
+        start, end = cursor % self.capacity, written % self.capacity
+        if written == cursor:
+            views = []
+        elif start < end:
+            views = [self.levels[start:end]]
+        else:
+            views = [self.levels[start:], self.levels[:end]]
+        return views, written, dropped
+
+    @staticmethod
+    def valid(view, cursor):
+        """
+            Whether the records of a view returned by read_levels(cursor) are still those that were read
+        """
+        return len(view) == 0 or int(view['seq'][0]) > cursor
+
+
+def run_worker(exchange_class, exchange_options, markets, ring_name, ready, stop, book_options):
+    asyncio.run(worker(exchange_class, exchange_options, markets, ring_name, ready, stop, book_options))
+
+
+async def worker(exchange_class, exchange_options, markets, ring_name, ready, stop, book_options):
+    ring = SharedBookRing(name=ring_name)
+    try:
+        async with exchange_class(**exchange_options) as exchange:
+            await exchange.subscribe_to_order_books(*markets, **book_options)
+            publishers = []
+            for i, market in enumerate(markets):
+                book = exchange.order_books[market]
+                levels, top = book.subscribe_to_levels(level_publisher(ring, i)), book.subscribe_to_top_of_book(1, top_of_book_publisher(ring, i, book))
+                publishers.append((book, levels, top))
+                snapshot = book.top_levels(book.level_count())
+                levels(snapshot['bids'], snapshot['asks'], book.previous_time, True)
+                top(None, book.top_levels(1))
+            ready.set()
+            while not stop.is_set():
+                await asyncio.sleep(0.1)
+            for book, levels, top in publishers:
+                book.unsubscribe_from_levels(levels)
+                book.unsubscribe_from_top_of_book(top)
+    finally:
+        ring.header['closed'] = 1
+        ready.set()
+        ring.close()
+
+
+def level_publisher(ring, market):
+    def publish(bids, asks, time, snapshot):
+        ring.write_levels(market, BID | (SNAPSHOT if snapshot else 0), bids if len(bids) or not snapshot else [[0.0, 0.0]], time)
+        ring.write_levels(market, ASK, asks, time)
+    return publish
+
+
+def top_of_book_publisher(ring, market, book):
+    def publish(old, new):
+        bid, bid_volume = new['bids'][0] if len(new['bids']) else (0.0, 0.0)
+        ask, ask_volume = new['asks'][0] if len(new['asks']) else (0.0, 0.0)
+        ring.write_top_of_book(market, book.previous_time, bid, bid_volume, ask, ask_volume)
+    return publish
+
+
+class MarketDataWorker:
+    """
+        Runs the order books of an exchange in a separate process and reads them from a SharedBookRing
+    """
+    def __init__(self, exchange_class, markets, capacity=2 ** 16, exchange_options=None, **book_options):
+        """
+            exchange_class: Exchange subclass to run in the worker, eg Binance
+            markets: list of (base, quote) markets to subscribe to
+            capacity: number of changed levels kept in the ring
+            exchange_options: passed to the exchange constructor in the worker
+            book_options: passed to subscribe_to_order_books in the worker
+        """
+        self.exchange_class = exchange_class
+        self.markets = list(markets)
+        self.market_index = {market: i for i, market in enumerate(self.markets)}
+        self.exchange_options = {} if exchange_options is None else exchange_options
+        self.book_options = book_options
+        self.ring = SharedBookRing(len(self.markets), capacity)
+        context = multiprocessing.get_context('spawn')
+        self.ready = context.Event()
+        self.stop = context.Event()
+        self.process = context.Process(target=run_worker, args=(exchange_class, self.exchange_options, self.markets, self.ring.name, self.ready, self.stop, book_options), daemon=True)
+        self.cursor = 0
+
+    async def start(self, timeout=60):
+        """
+            Start the worker and wait until its order books are initialised
+        """
+        self.process.start()
+        start = time.time()
+        while not self.ready.is_set() and self.process.is_alive() and time.time() - start < timeout:
+            await asyncio.sleep(0.05)
+        if not self.ready.is_set() or self.ring.closed():
+            await self.close()
+            raise Exception('Market data worker failed to start')
+
+    async def close(self, timeout=10):
+        self.stop.set()
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self.process.join, timeout)
+        if self.process.is_alive():
+            self.process.terminate()
+        self.ring.close()
+
+    def alive(self):
+        return self.process.is_alive() and not self.ring.closed()
+
+    def top_of_book(self, market):
+        """
+            Returns (time, bid, bid volume, ask, ask volume) of a market
+        """
+        return self.ring.top_of_book(self.market_index[market])
+
+    def mid_price(self, market):
+        top = self.top_of_book(market)
+        if top is None or top[1] == 0 or top[3] == 0:
+            return None
+        return (top[1] + top[3]) / 2
+
+    def changed_levels(self):
+        """
+            Returns (views, dropped), numpy views of the level records written since the last call and the
+            number that were overwritten before being read, see SharedBookRing.read_levels
+        """
+        cursor = self.cursor
+        views, self.cursor, dropped = self.ring.read_levels(cursor)
+        return views, dropped
@@ -1,31 +1,202 @@
-import asyncio
+import asyncio, logging, os, random, struct, sys
 from contextlib import suppress
+from collections import deque
+from bisect import bisect_left, bisect_right, insort
+from decimal import Decimal
 import binascii
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_HEADER = struct.Struct('<4sHqII') #magic, version, last update id, number of bids, number of asks
+SNAPSHOT_MAGIC = b'CBOB'
+SNAPSHOT_VERSION = 1 #float64 levels
+SNAPSHOT_FIXED_POINT_VERSION = 2 #int64 levels in ticks and lots
+
+
+class PriceLevels(dict):
+    """
+        Dictionary of price: volume that also keeps its prices sorted, so the best price
+        and the top levels of the book can be read without sorting the whole side
+            reverse: True for bids, where the best price is the highest
+    """
+    def __init__(self, levels=(), reverse=False):
+        super().__init__(levels)
+        self.reverse = reverse
+        self.prices = sorted(self)
+
+    def __setitem__(self, price, volume):
+        if price not in self:
+            insort(self.prices, price)
+        super().__setitem__(price, volume)
+
+    def __delitem__(self, price):
+        super().__delitem__(price)
+        del self.prices[bisect_left(self.prices, price)]
+
+    def pop(self, price, *default):
+        if price in self:
+            volume = super().pop(price)
+            del self.prices[bisect_left(self.prices, price)]
+            return volume
+        return super().pop(price, *default)
+
+    def popitem(self):
+        price = self.prices[0] if self.reverse else self.prices[-1]
+        return price, self.pop(price)
+
+    def setdefault(self, price, volume=None):
+        if price not in self:
+            self[price] = volume
+        return self[price]
+
+    def update(self, *args, **kwargs):
+        for price, volume in dict(*args, **kwargs).items():
+            self[price] = volume
+
+    def clear(self):
+        super().clear()
+        self.prices = []
+
+    def apply(self, updates):
+        """
+            Apply a list of [price, volume] updates, removing the levels with zero volume
+        """
+        for price, volume in updates:
+            if volume == 0:
+                self.pop(price, None)
+            else:
+                self[price] = volume
+
+    def trim(self, depth=None, distance=None):
+        """
+            Remove the levels more than depth levels or more than distance in price from the best price
+        """
+        if len(self.prices) == 0:
+            return
+        keep = len(self.prices) if depth is None else min(depth, len(self.prices))
+        if distance is not None:
+            if self.reverse:
+                keep = min(keep, len(self.prices) - bisect_left(self.prices, self.prices[-1] - distance))
+            else:
+                keep = min(keep, bisect_right(self.prices, self.prices[0] + distance))
+        if keep == len(self.prices):
+            return
+        #deleting in place costs the removed levels for asks, bids also shift the kept levels to the front
+        if self.reverse:
+            removed = self.prices[:len(self.prices) - keep]
+            del self.prices[:len(self.prices) - keep]
+        else:
+            removed = self.prices[keep:]
+            del self.prices[keep:]
+        for price in removed:
+            super().__delitem__(price)
+
+    def memory_usage(self):
+        """
+            Approximate bytes used by the levels, including the price and volume objects
+        """
+        return sys.getsizeof(self) + sys.getsizeof(self.prices) + len(self) * 2 * sys.getsizeof(0.0)
+
+    def best(self):
+        """
+            Returns the best price on this side of the book
+        """
+        if not self.prices:
+            raise ValueError('No price levels')
+        return self.prices[-1] if self.reverse else self.prices[0]
+
+    def top(self, depth=5):
+        """
+            Returns the best depth prices, best first
+        """
+        if self.reverse:
+            return self.prices[:-depth - 1:-1]
+        return self.prices[:depth]
+
+
+class InlineUpdates:
+    """
+        Stands in for the update queue of an OrderBook created without one, applying each update to the
+        book as soon as it is put rather than in a task of its own
+    """
+    def __init__(self, book):
+        self.book = book
+
+    def put_nowait(self, update):
+        try:
+            self.book.handle_update(update)
+        except Exception as e:
+            print('Error applying order book update', repr(e))
+            self.book.resync_order_book()
+
+    async def put(self, update):
+        self.put_nowait(update)
 
 
 class OrderBook:
     """
         Handle basic order book operations and computations
     """
-    def __init__(self,  update_queue):
-        self.update_queue = update_queue
-        self.unhandled_updates = []
-        self.initialised = False
+    def __init__(self,  update_queue, resync=None, batch_updates=False, max_depth=None, max_distance=None, checksum_depth=None, max_buffered_updates=10000):
+        """
+            update_queue: queue of updates and snapshots from the exchange, or None to apply each update as it
+                is put on the book's InlineUpdates update_queue, without a task or queue per book
+            resync: coroutine function that requests a new snapshot, called when an update is missed and retried
+                with backoff until it succeeds
+            batch_updates: drain everything queued and apply it as one merged update
+            max_depth, max_distance: drop levels more than max_depth levels or max_distance in price from
+                the best price on their side, to bound the memory of the book. Levels that are dropped
+                are not restored if the touch later moves towards them.
+            checksum_depth: keep a CRC32 checksum of the top checksum_depth levels of each side in checksum
+            max_buffered_updates: number of updates kept while waiting for a snapshot, older updates are dropped
+                and the book resyncs again if the snapshot is older than the updates kept
+        """
+        self.update_queue = InlineUpdates(self) if update_queue is None else update_queue
+        self.max_depth = max_depth
+        self.max_distance = max_distance
+        self.batch_updates = batch_updates
+        self.resync = resync
+        self.resync_task = None
+        self.resync_requested = False
+        self.resyncs = 0
+        self.awaiting_first_update = True
+        self.unhandled_updates = deque(maxlen=max_buffered_updates)
+        self.initialised = False #levels are live, from a snapshot or a checkpoint followed by a live update
+        self.restored = False #levels are from a checkpoint that no live update has followed on from yet
         self.initialised_event = asyncio.Event()
         self.previous_time = 0
-        self.update_parser = asyncio.create_task(self.parse_updates())  
+        self.update_parser = asyncio.create_task(self.parse_updates()) if update_queue is not None else None
         self.update_event = asyncio.Event()
         self.subscribed = True
-        self.correct = False
+        self.correct = None #set by verify_snapshot, None until a book has been verified
         self.checksum = 0
+        self.venue_checksum = None
+        self.checksum_depth = checksum_depth
+        self.checksum_levels = None
+        self.level_checksums = {}
+        self.checksum_history = deque(maxlen=100) #(first, time, checksum, levels, changed prices) while verifying
+        self.verifications = 0
+        self.unverified_checksum_depth = checksum_depth #restored when verification stops
         self.record_updates = False #allow access to updates 
         self.update_queue_passthrough = asyncio.Queue()
+        self.depth_views = {}
+        self.top_of_book = {} #{depth: last levels}
+        self.top_of_book_subscriptions = []
+        self.level_subscriptions = []
+        self.set_levels([], [])
 
     async def close(self):
         self.subscribed = False
-        self.update_parser.cancel()
+        if self.update_parser is not None:
+            self.update_parser.cancel()
+        if self.resync_task is not None:
+            self.resync_task.cancel()
         with suppress(asyncio.CancelledError):
-            await self.update_parser
+            if self.update_parser is not None:
+                await self.update_parser
+            if self.resync_task is not None:
+                await self.resync_task
 
 
     def passthrough_updates(self, mode=True):
@@ -35,93 +206,957 @@ class OrderBook:
         else:
             self.record_updates = False
 
+    def set_levels(self, bids, asks):
+        """
+            Replace the levels of the book with those from a snapshot
+        """
+        self.bids = PriceLevels(bids, reverse=True)
+        self.asks = PriceLevels(asks)
+        self.depth_views = {}
+        if self.max_depth is not None or self.max_distance is not None:
+            self.bids.trim(self.max_depth, self.max_distance)
+            self.asks.trim(self.max_depth, self.max_distance)
+
+    def apply_levels(self, bids, asks):
+        """
+            Apply lists of [price, volume] changes to the book, zero volume removes the level
+        """
+        trim = self.max_depth is not None or self.max_distance is not None
+        if len(bids):
+            self.bids.apply(bids)
+            if trim:
+                self.bids.trim(self.max_depth, self.max_distance)
+            self.depth_views.pop('bids', None)
+        if len(asks):
+            self.asks.apply(asks)
+            if trim:
+                self.asks.trim(self.max_depth, self.max_distance)
+            self.depth_views.pop('asks', None)
+
+    def memory_usage(self):
+        """
+            Approximate number of bytes used to store the levels of the book
+        """
+        return self.bids.memory_usage() + self.asks.memory_usage()
+
+    def level_count(self):
+        '''Number of levels on the deeper side of the book'''
+        return max(len(self.bids), len(self.asks))
+
     def mid_price(self):
         if not self.initialised:
             raise Exception('Orderbook not initialised')
-        return (max(self.bids) + min(self.asks)) / 2
+        return (self.bids.best() + self.asks.best()) / 2
 
     def sell_price(self):
         """
             Get the current best market sell price - the current highest bid
 
         """
-        return max(self.bids)
+        return self.bids.best()
 
     def buy_price(self):
         """
             Gives the current best market buy price - the lowest ask
 
         """
-        return min(self.asks)
+        return self.asks.best()
 
 
     def get_bids(self, depth=5):
         """
             Returns the best bid prices
         """
-        return sorted(self.bids, reverse=True)[:depth]
+        return self.bids.top(depth)
 
 
     def get_asks(self, depth=5):
         """
             Returns the best ask prices
         """
-        return sorted(self.asks)[:depth]
+        return self.asks.top(depth)
+
+    def depth_view(self, side):
+        """
+            Returns numpy arrays of the prices, volumes, cumulative volumes and cumulative quote volumes
+            of a side of the book ordered from the touch outwards. The arrays are cached and only
+            rebuilt after an update has changed that side.
+                side: 'bids' or 'asks'
+        """
+        if side not in self.depth_views:
+            levels = self.bids if side == 'bids' else self.asks
+            prices = np.array(levels.top(len(levels)), dtype=float)
+            volumes = np.fromiter(map(levels.__getitem__, prices.tolist()), dtype=float, count=len(prices))
+            self.depth_views[side] = self.build_depth_view(prices, volumes)
+        return self.depth_views[side]
 
+    @staticmethod
+    def build_depth_view(prices, volumes):
+        return prices, volumes, np.cumsum(volumes), np.cumsum(prices * volumes)
 
+    def cumulative_volume(self, side, depth=None):
+        """
+            Returns arrays of prices and the cumulative volume up to each price, from the touch outwards
+        """
+        prices, _, cumulative, _ = self.depth_view(side)
+        return prices[:depth], cumulative[:depth]
+
+    def fill_price(self, side, volume=None, quote_volume=None):
+        """
+            Price a market order for volume of the base asset or quote_volume of the quote asset
+                side: 'buy' takes the asks, 'sell' takes the bids
+            Returns a dict with the volume and quote volume that the book can fill, the average and worst
+            fill prices, the slippage of the average price from the mid price in basis points and whether
+            the whole order can be filled
+        """
+        if (volume is None) == (quote_volume is None):
+            raise ValueError('Specify exactly one of volume and quote_volume')
+        if side not in ('buy', 'sell'):
+            raise ValueError(f"Side must be 'buy' or 'sell', not {side!r}")
+        if (volume if volume is not None else quote_volume) <= 0:
+            raise ValueError('Order volume must be positive')
+        prices, volumes, cumulative, cumulative_quote = self.depth_view('asks' if side == 'buy' else 'bids')
+        if len(prices) == 0:
+            raise ValueError('No price levels')
+        totals, target = (cumulative, volume) if volume is not None else (cumulative_quote, quote_volume)
+        last = min(int(np.searchsorted(totals, target)), len(prices) - 1)
+        filled = bool(totals[last] >= target)
+        base_before = cumulative[last - 1] if last > 0 else 0.0
+        quote_before = cumulative_quote[last - 1] if last > 0 else 0.0
+        if not filled:
+            base, quote = cumulative[last], cumulative_quote[last]
+        elif volume is not None:
+            base = volume
+            quote = quote_before + (volume - base_before) * prices[last]
+        else:
+            quote = quote_volume
+            base = base_before + (quote_volume - quote_before) / prices[last]
+        average_price = quote / base
+        mid_price = self.mid_price()
+        slippage = (average_price - mid_price) / mid_price * 10 ** 4
+        return {
+            'volume': float(base),
+            'quote_volume': float(quote),
+            'average_price': float(average_price),
+            'worst_price': float(prices[last]),
+            'slippage': float(slippage if side == 'buy' else -slippage),
+            'filled': filled
+        }
+
+    def vwap(self, side, volume):
+        """
+            Volume weighted average price of taking volume from a side of the book, None if the
+            book does not hold enough volume
+                side: 'bids' or 'asks'
+        """
+        if side not in ('bids', 'asks'):
+            raise ValueError(f"Side must be 'bids' or 'asks', not {side!r}")
+        fill = self.fill_price('buy' if side == 'asks' else 'sell', volume)
+        return fill['average_price'] if fill['filled'] else None
+
+    def volume_within(self, side, bps):
+        """
+            Volume available on a side of the book within bps basis points of the mid price
+        """
+        prices, _, cumulative, _ = self.depth_view(side)
+        mid_price = self.mid_price()
+        if side == 'bids':
+            levels = int(np.searchsorted(-prices, -mid_price * (1 - bps / 10 ** 4), side='right'))
+        else:
+            levels = int(np.searchsorted(prices, mid_price * (1 + bps / 10 ** 4), side='right'))
+        return float(cumulative[levels - 1]) if levels > 0 else 0.0
+
+
+
+    def save(self, path, fixed_point=False):
+        """
+            Checkpoint the levels of the book and the last update id to a binary file, which
+            load_snapshot reads back to warm start the book
+                fixed_point: the book holds integer ticks and lots, which are stored as int64
+        """
+        if not self.initialised:
+            raise Exception('Orderbook not initialised')
+        version, dtype = (SNAPSHOT_FIXED_POINT_VERSION, '<i8') if fixed_point else (SNAPSHOT_VERSION, '<f8')
+        bid_prices, bid_volumes, _, _ = self.depth_view('bids')
+        ask_prices, ask_volumes, _, _ = self.depth_view('asks')
+        bids, asks = np.stack([bid_prices, bid_volumes], axis=1), np.stack([ask_prices, ask_volumes], axis=1)
+        if fixed_point:
+            bids, asks = np.rint(bids), np.rint(asks)
+        temporary_path = path + '.tmp'
+        with open(temporary_path, 'wb') as f:
+            f.write(SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, version, self.previous_time, len(bid_prices), len(ask_prices)))
+            f.write(bids.astype(dtype).tobytes())
+            f.write(asks.astype(dtype).tobytes())
+        os.replace(temporary_path, path)
+
+    @staticmethod
+    def load_snapshot(path, fixed_point=False):
+        """
+            Read a file written by save into a snapshot update for the order book queue. The book
+            only reports as initialised once the first live update follows on from the snapshot.
+            Raises ValueError if the file was not saved with the same fixed_point.
+        """
+        with open(path, 'rb') as f:
+            data = f.read()
+        magic, version, time, n_bids, n_asks = SNAPSHOT_HEADER.unpack_from(data)
+        if magic != SNAPSHOT_MAGIC or version != (SNAPSHOT_FIXED_POINT_VERSION if fixed_point else SNAPSHOT_VERSION):
+            raise ValueError(f'{path} is not an order book snapshot' + (' in ticks and lots' if fixed_point else ''))
+        levels = np.frombuffer(data, dtype='<i8' if fixed_point else '<f8', offset=SNAPSHOT_HEADER.size).reshape(-1, 2)
+        return {'initial': True, 'restored': True, 'time': time, 'bids': levels[:n_bids].tolist(), 'asks': levels[n_bids:n_bids + n_asks].tolist()}
+
+    def top_levels(self, depth=1):
+        """
+            Returns the top depth levels of each side as {'bids': [(price, volume), ...], 'asks': [...]}
+        """
+        return {
+            'bids': [(price, self.bids[price]) for price in self.bids.top(depth)],
+            'asks': [(price, self.asks[price]) for price in self.asks.top(depth)]
+        }
+
+    def subscribe_to_top_of_book(self, depth=1, callback=None):
+        """
+            Get notified only when the top depth levels of the book change, rather than on every update
+                depth: number of levels on each side to watch, 1 for the best bid and ask
+                callback: called with (old, new) when the levels change. If None a queue is returned
+                    that receives {'old': old, 'new': new} dicts
+            old and new are in the format returned by top_levels, old is None for the first notification.
+            When the book resyncs new has no levels, then old is None for the first notification after it.
+            Returns the queue or callback, which can be passed to unsubscribe_from_top_of_book
+        """
+        target = asyncio.Queue() if callback is None else callback
+        self.top_of_book_subscriptions.append((depth, target))
+        if depth not in self.top_of_book:
+            self.top_of_book[depth] = self.top_levels(depth) if self.initialised else None
+        return target
+
+    def unsubscribe_from_top_of_book(self, target):
+        self.top_of_book_subscriptions = [(d, t) for d, t in self.top_of_book_subscriptions if t is not target]
+        depths = set(d for d, _ in self.top_of_book_subscriptions)
+        self.top_of_book = {d: v for d, v in self.top_of_book.items() if d in depths}
+
+    def notify_top_of_book(self, bids=None, asks=None):
+        """
+            Notify the top of book subscribers whose levels have changed
+                bids, asks: the levels changed by the update, None after a snapshot
+        """
+        if len(self.top_of_book_subscriptions) == 0:
+            return
+        changes = {}
+        for depth, old in self.top_of_book.items():
+            if old is not None and bids is not None and not self.touches_levels(old, depth, bids, asks):
+                continue
+            new = self.top_levels(depth)
+            if new != old:
+                self.top_of_book[depth] = new
+                changes[depth] = (old, new)
+        self.send_top_of_book(changes)
+
+    def clear_top_of_book(self):
+        '''Notify the top of book subscribers that the book has no live levels while it resyncs'''
+        empty = {'bids': [], 'asks': []}
+        changes = {depth: (old, empty) for depth, old in self.top_of_book.items() if old is not None}
+        self.top_of_book = {depth: None for depth in self.top_of_book}
+        self.send_top_of_book(changes)
+
+    def send_top_of_book(self, changes):
+        for depth, target in self.top_of_book_subscriptions:
+            if depth not in changes:
+                continue
+            old, new = changes[depth]
+            #a failing subscriber must not stop the book or make it resync
+            try:
+                if isinstance(target, asyncio.Queue):
+                    target.put_nowait({'old': old, 'new': new})
+                else:
+                    target(old, new)
+            except Exception:
+                logger.exception('Error in top of book subscriber %r', target)
+
+    def subscribe_to_levels(self, callback):
+        """
+            Get every change to the levels of the book
+                callback: called with (bids, asks, time, snapshot) after each diff is applied. After a
+                    snapshot it is called with all the levels of the book and snapshot True
+        """
+        self.level_subscriptions.append(callback)
+        return callback
+
+    def unsubscribe_from_levels(self, callback):
+        self.level_subscriptions = [c for c in self.level_subscriptions if c is not callback]
+
+    def notify_levels(self, bids, asks, snapshot=False):
+        for callback in self.level_subscriptions:
+            try:
+                callback(bids, asks, self.previous_time, snapshot)
+            except Exception:
+                logger.exception('Error in level subscriber %r', callback)
+
+    @staticmethod
+    def touches_levels(levels, depth, bids, asks):
+        """
+            Whether changes to bids and asks can affect the top depth levels
+        """
+        if len(levels['bids']) < depth or len(levels['asks']) < depth:
+            return True
+        worst_bid, worst_ask = levels['bids'][-1][0], levels['asks'][-1][0]
+        return any(price >= worst_bid for price, _ in bids) or any(price <= worst_ask for price, _ in asks)
 
     async def parse_updates(self):
         while self.subscribed:
-            update = await self.update_queue.get()
-            if 'checksum' in update:
-                self.checksum = update['checksum']
-            if 'unsubscribed' in update:
-                self.subscribed = False
-                self.update_queue.task_done()
-                break
-            self.update_event.set()
-            self.update_event.clear()
-            if self.record_updates:
-                await self.update_queue_passthrough.put(update)
-            if update['time'] < self.previous_time:
+            updates = [await self.update_queue.get()]
+            if self.batch_updates:
+                while not self.update_queue.empty():
+                    updates.append(self.update_queue.get_nowait())
+            self.handle_updates(updates)
+            for _ in updates:
                 self.update_queue.task_done()
+
+    def handle_update(self, update):
+        """
+            Apply an update or snapshot from the exchange and notify any listeners
+        """
+        self.handle_updates([update])
+
+    def handle_updates(self, updates):
+        """
+            Apply a list of updates and snapshots from the exchange, merging consecutive diffs so that
+            each price level is written once, and notify any listeners once for the whole list
+        """
+        self.update_event.set()
+        self.update_event.clear()
+        if self.record_updates:
+            for update in updates:
+                self.update_queue_passthrough.put_nowait(update)
+        if len(updates) == 1:
+            self.apply_update(updates[0])
+            return
+        changed = False
+        for update in self.merge_updates(updates):
+            changed = self.apply_update(update, notify=False) or changed
+        if changed:
+            self.notify_top_of_book()
+
+    def apply_update(self, update, notify=True):
+        """
+            Apply a single update or snapshot, returns True if the levels of the book changed
+        """
+        if 'checksum' in update:
+            self.venue_checksum = update['checksum']
+        if 'unsubscribed' in update:
+            self.subscribed = False
+            return False
+        if (self.initialised or self.restored) and update['time'] <= self.previous_time:
+            return False
+        if 'initial' in update:
+            return self.apply_snapshot(update, notify)
+        elif not (self.initialised or self.restored):
+            self.unhandled_updates.append(update)
+        elif self.in_sequence(update):
+            self.apply_levels(update['bids'], update['asks'])
+            self.previous_time = update['time']
+            self.awaiting_first_update = False
+            self.initialised = True
+            self.restored = False
+            self.initialised_event.set()
+            self.record_checksum(update)
+            if len(self.level_subscriptions):
+                self.notify_levels(update['bids'], update['asks'])
+            if notify:
+                self.notify_top_of_book(update['bids'], update['asks'])
+            return True
+        else:
+            self.resync_order_book(update)
+        return False
+
+    @staticmethod
+    def merge_updates(updates):
+        """
+            Merge runs of consecutive diffs into single diffs keeping the last volume of each price level
+        """
+        merged = None
+        for update in updates:
+            if merged is not None and OrderBook.follows(merged, update):
+                merged = {**merged, 'time': update['time'], 'bids': merged['bids'] + [update['bids']], 'asks': merged['asks'] + [update['asks']]}
                 continue
-            if not self.initialised:
-                if 'initial' in update:
-                    self.bids = {price: volume for price, volume in update['bids']}
-                    self.asks = {price: volume for price, volume in update['asks']} 
-                    self.unhandled_updates = [u for u in self.unhandled_updates if u['time'] > update['time']]
-                    self.previous_time = update['time']
-                    self.initialised = True
-                    self.initialised_event.set()
-                    for update in self.unhandled_updates:
-                        for bid, volume in update['bids']:
-                            self.bids[bid] = volume 
-                            if volume == 0:
-                                del self.bids[bid]
-                        for ask, volume in update['asks']:
-                            self.asks[ask] = volume
-                            if volume == 0:
-                                del self.asks[ask]
-
-                    self.unhandled_updates = []
-                    
-                else:
-                    self.unhandled_updates.append(update)
+            if merged is not None:
+                yield OrderBook.merge_levels(merged)
+            if 'initial' in update or 'unsubscribed' in update or 'checksum' in update:
+                merged = None
+                yield update
+            else:
+                merged = {**update, 'bids': [update['bids']], 'asks': [update['asks']]}
+        if merged is not None:
+            yield OrderBook.merge_levels(merged)
+
+    @staticmethod
+    def follows(merged, update):
+        """
+            Whether update is a diff that directly follows the merged diffs
+        """
+        if 'initial' in update or 'unsubscribed' in update or 'checksum' in update:
+            return False
+        if 'previous' in update:
+            return update['previous'] == merged['time']
+        if 'first' in update:
+            return update['first'] == merged['time'] + 1
+        return update['time'] >= merged['time']
+
+    @staticmethod
+    def merge_levels(merged):
+        for side in ('bids', 'asks'):
+            levels = merged[side]
+            if len(levels) == 1:
+                merged[side] = levels[0]
             else:
-                for bid, volume in update['bids']:
-                    self.bids[bid] = volume
-                    if volume == 0:
-                        del self.bids[bid]
-                for ask, volume in update['asks']:
-                    self.asks[ask] = volume
-                    if volume == 0:
-                        del self.asks[ask]
+                merged[side] = list({price: volume for l in levels for price, volume in l}.items())
+        return merged
+
+    def apply_snapshot(self, snapshot, notify=True):
+        """
+            Replace the book with a snapshot and apply the buffered updates that follow it
+        """
+        self.set_levels(snapshot['bids'], snapshot['asks'])
+        self.previous_time = snapshot['time']
+        self.awaiting_first_update = True
+        self.checksum_history.clear()
+        self.record_checksum(snapshot)
+        unhandled_updates = [u for u in self.unhandled_updates if u['time'] > snapshot['time']]
+        self.unhandled_updates.clear()
+        for i, update in enumerate(unhandled_updates):
+            if not self.in_sequence(update):
+                self.resync_order_book(*unhandled_updates[i:])
+                return False
+            self.apply_levels(update['bids'], update['asks'])
+            self.previous_time = update['time']
+            self.awaiting_first_update = False
+            self.record_checksum(update)
+        #a checkpoint is only live once a live update follows on from it
+        self.restored = 'restored' in snapshot and self.awaiting_first_update
+        self.initialised = not self.restored
+        if self.initialised:
+            self.initialised_event.set()
+        if len(self.level_subscriptions):
+            levels = self.top_levels(self.level_count())
+            self.notify_levels(levels['bids'], levels['asks'], snapshot=True)
+        if notify:
+            self.notify_top_of_book()
+        return True
+
+    @staticmethod
+    def levels_checksum(levels, cache=None):
+        """
+            CRC32 checksum of top levels in the format of top_levels, the sum of the CRC32 of each level.
+            cache is a {side: {price: (volume, crc)}} dict of previously hashed levels, so only the levels
+            that changed since the last call are hashed again.
+        """
+        checksum = 0
+        for side in ('bids', 'asks'):
+            side_cache = {} if cache is None else cache.get(side, {})
+            hashed = {}
+            for price, volume in levels[side]:
+                cached = side_cache.get(price)
+                if cached is None or cached[0] != volume:
+                    cached = (volume, binascii.crc32(f'{side[0]}{float(price)}:{float(volume)}'.encode()))
+                hashed[price] = cached
+                checksum += cached[1]
+            if cache is not None:
+                cache[side] = hashed
+        return checksum & 0xffffffff
+
+    def record_checksum(self, update):
+        """
+            Update the checksum of the top checksum_depth levels if the update touched them, and
+            record the state of the top of the book while a verification is running
+        """
+        if self.checksum_depth is None:
+            return
+        if 'initial' in update or self.checksum_levels is None or self.touches_levels(self.checksum_levels, self.checksum_depth, update['bids'], update['asks']):
+            self.checksum_levels = self.top_levels(self.checksum_depth)
+            self.checksum = self.levels_checksum(self.checksum_levels, self.level_checksums)
+        if self.verifications > 0:
+            changed = {side: set(p for p, _ in update[side]) for side in ('bids', 'asks')} if 'initial' not in update else None
+            self.checksum_history.append((update.get('first', update['time']), update['time'], self.checksum, self.checksum_levels, changed))
+
+    def verify_snapshot(self, snapshot):
+        """
+            Compare a REST snapshot limited to checksum_depth levels with the recorded state of the book at
+            the snapshot update id. Returns True if they match, False if the book has drifted and None if the
+            book has no record of that update id.
+            If the snapshot falls within a diff, the levels that diff changed are not compared.
+        """
+        levels = {side: [(p, v) for p, v in snapshot[side]][:self.checksum_depth] for side in ('bids', 'asks')}
+        history = list(self.checksum_history)
+        for i, (first, time, checksum, top_levels, changed) in enumerate(history):
+            if time == snapshot['time']:
+                self.correct = checksum == self.levels_checksum(levels)
+                return self.correct
+            if first <= snapshot['time'] < time and i > 0:
+                _, _, _, previous_levels, _ = history[i - 1]
+                self.correct = self.compare_levels(previous_levels, levels, changed)
+                return self.correct
+        return None
+
+    @staticmethod
+    def compare_levels(book_levels, snapshot_levels, changed):
+        """
+            Whether two sets of top levels agree on the prices both cover, ignoring the changed prices
+        """
+        for side in ('bids', 'asks'):
+            book, snapshot = dict(book_levels[side]), dict(snapshot_levels[side])
+            if len(book) == 0 or len(snapshot) == 0:
+                continue
+            if side == 'bids':
+                limit = max(min(book), min(snapshot))
+                covered = lambda price: price >= limit
+            else:
+                limit = min(max(book), max(snapshot))
+                covered = lambda price: price <= limit
+            ignored = changed[side] if changed is not None else set()
+            book = {p: v for p, v in book.items() if covered(p) and p not in ignored}
+            snapshot = {p: v for p, v in snapshot.items() if covered(p) and p not in ignored}
+            if book != snapshot:
+                return False
+        return True
+
+    def start_verification(self, depth):
+        """
+            Start recording the top depth levels for verify_snapshot, call stop_verification when done
+        """
+        if self.verifications == 0:
+            self.unverified_checksum_depth = self.checksum_depth
+        if self.checksum_depth != depth:
+            self.set_checksum_depth(depth)
+        self.verifications += 1
+        if self.initialised:
+            self.record_checksum({'initial': True, 'time': self.previous_time})
+
+    def stop_verification(self):
+        self.verifications -= 1
+        if self.verifications == 0:
+            self.checksum_history.clear()
+            if self.checksum_depth != self.unverified_checksum_depth:
+                self.set_checksum_depth(self.unverified_checksum_depth)
+                if self.checksum_depth is not None and self.initialised:
+                    self.record_checksum({'initial': True, 'time': self.previous_time})
+
+    def set_checksum_depth(self, depth):
+        self.checksum_depth = depth
+        self.checksum_levels = None
+        self.level_checksums = {}
+
+    def in_sequence(self, update):
+        """
+            Whether an update follows on from the last update applied to the book, using the
+            first (U) and previous (pu, futures only) update ids when the exchange provides them
+        """
+        if 'first' not in update:
+            return True
+        if self.awaiting_first_update:
+            #first update after a snapshot must contain the snapshot update id
+            if 'previous' in update:
+                return update['first'] <= self.previous_time <= update['time'] or update['previous'] == self.previous_time
+            return update['first'] <= self.previous_time + 1 <= update['time']
+        if 'previous' in update:
+            return update['previous'] == self.previous_time
+        return update['first'] == self.previous_time + 1
+
+    def resync_order_book(self, *updates, wait=0):
+        """
+            Reset the book after a missed update and request a new snapshot, buffering updates until it arrives
+                wait: seconds to wait before requesting the snapshot, to spread the requests of many books
+        """
+        self.initialised = False
+        self.restored = False
+        self.correct = None
+        self.initialised_event.clear()
+        self.unhandled_updates.clear()
+        self.unhandled_updates.extend(updates)
+        self.clear_top_of_book()
+        self.resyncs += 1
+        if self.resync is None:
+            return
+        self.resync_requested = True
+        if self.resync_task is None or self.resync_task.done():
+            self.resync_task = asyncio.create_task(self.request_resyncs(wait))
+
+    async def request_resyncs(self, wait=0, delay=0.5, max_delay=30):
+        """
+            Request snapshots until one is delivered after the last call to resync_order_book, retrying failed
+            requests with jittered exponential backoff
+        """
+        if wait > 0:
+            await asyncio.sleep(wait)
+        retry_delay = delay
+        while self.resync_requested and self.subscribed:
+            self.resync_requested = False
+            try:
+                await self.resync()
+                retry_delay = delay
+            except Exception as e:
+                print('Error requesting order book snapshot', repr(e))
+                self.resync_requested = True
+                await asyncio.sleep(random.uniform(retry_delay / 2, retry_delay))
+                retry_delay = min(retry_delay * 2, max_delay)
+
+
+class TickOrderBook(OrderBook):
+    """
+        Order book storing each side as a dense numpy array of volumes indexed by integer tick.
+        The arrays cover a window of size ticks which is recentred around the touch whenever the
+        best prices get close to its edges, levels outside of the window are dropped. The window
+        doubles in size when the spread gets too wide for both touches to fit in it.
+            price_increment: tick size of the market, eg market.price_increment
+            size: number of ticks initially covered by the window
+    """
+    def __init__(self, update_queue, price_increment, size=4096, **options):
+        self.price_increment = price_increment
+        self.decimals = max(0, -Decimal(repr(price_increment)).normalize().as_tuple().exponent)
+        self.size = size
+        self.margin = size // 8
+        self.origin = 0
+        self.best = None
+        self.bid_volumes = np.zeros(size)
+        self.ask_volumes = np.zeros(size)
+        super().__init__(update_queue, **options)
+
+    #{price: volume} copies of the sides built on each access, the book methods use the arrays instead
+    @property
+    def bids(self):
+        index = np.flatnonzero(self.bid_volumes)
+        return dict(zip(self.to_prices(index).tolist(), self.bid_volumes[index].tolist()))
+
+    @property
+    def asks(self):
+        index = np.flatnonzero(self.ask_volumes)
+        return dict(zip(self.to_prices(index).tolist(), self.ask_volumes[index].tolist()))
+
+    def level_count(self):
+        return max(np.count_nonzero(self.bid_volumes), np.count_nonzero(self.ask_volumes))
+
+    def to_ticks(self, prices):
+        return np.rint(np.asarray(prices, dtype=float) / self.price_increment).astype(np.int64)
+
+    def to_prices(self, index):
+        """
+            Convert window indices to prices
+        """
+        return np.round((index + self.origin) * self.price_increment, self.decimals)
+
+    def recentre(self, centre):
+        """
+            Move the window so that it is centred on the centre tick, keeping the levels that overlap
+        """
+        shift = centre - self.size // 2 - self.origin
+        for volumes in (self.bid_volumes, self.ask_volumes):
+            if abs(shift) >= self.size:
+                volumes[:] = 0
+            elif shift > 0:
+                volumes[:-shift] = volumes[shift:]
+                volumes[-shift:] = 0
+            elif shift < 0:
+                volumes[-shift:] = volumes[:shift]
+                volumes[:-shift] = 0
+        self.origin += shift
+        self.best = None
+
+    def resize(self, size, centre):
+        """
+            Replace the window with one of size ticks centred on the centre tick, keeping the levels that overlap
+        """
+        origin = centre - size // 2
+        low, high = max(origin, self.origin), min(origin + size, self.origin + self.size)
+        for side in ('bid_volumes', 'ask_volumes'):
+            volumes = np.zeros(size)
+            if high > low:
+                volumes[low - origin:high - origin] = getattr(self, side)[low - self.origin:high - self.origin]
+            setattr(self, side, volumes)
+        self.origin, self.size, self.margin = origin, size, size // 8
+        self.best = None
+
+    def fitting_size(self, spread):
+        '''Window size, doubling the current size, with room for a spread of spread ticks away from the margins'''
+        size = self.size
+        while spread >= size - 2 * (size // 8):
+            size *= 2
+        return size
+
+    def write_levels(self, volumes, ticks, levels):
+        index = ticks - self.origin
+        inside = (index >= 0) & (index < self.size)
+        volumes[index[inside]] = levels[inside, 1]
+        self.best = None
+
+    def best_indices(self):
+        """
+            Returns the window indices of the best bid and ask, cached until the next write
+        """
+        if self.best is None:
+            best_bid = self.size - 1 - int(np.argmax(self.bid_volumes[::-1] != 0))
+            best_ask = int(np.argmax(self.ask_volumes != 0))
+            self.best = (best_bid if self.bid_volumes[best_bid] != 0 else None), (best_ask if self.ask_volumes[best_ask] != 0 else None)
+        return self.best
 
-            self.update_queue.task_done()
+    def set_levels(self, bids, asks):
+        bids = np.asarray(bids, dtype=float).reshape(-1, 2)
+        asks = np.asarray(asks, dtype=float).reshape(-1, 2)
+        bid_ticks, ask_ticks = self.to_ticks(bids[:, 0]), self.to_ticks(asks[:, 0])
+        self.bid_volumes[:] = 0
+        self.ask_volumes[:] = 0
+        self.best = None
+        touch = np.concatenate([np.sort(bid_ticks[bids[:, 1] > 0])[-1:], np.sort(ask_ticks[asks[:, 1] > 0])[:1]])
+        if len(touch):
+            centre = int(touch.sum() // len(touch))
+            size = self.fitting_size(int(touch.max() - touch.min()))
+            if size != self.size:
+                self.resize(size, centre)
+            self.origin = centre - self.size // 2
+        self.write_levels(self.bid_volumes, bid_ticks, bids)
+        self.write_levels(self.ask_volumes, ask_ticks, asks)
+        self.trim()
+        self.depth_views = {}
+
+    def apply_levels(self, bids, asks):
+        bids = np.asarray(bids, dtype=float).reshape(-1, 2)
+        asks = np.asarray(asks, dtype=float).reshape(-1, 2)
+        bid_ticks, ask_ticks = self.to_ticks(bids[:, 0]), self.to_ticks(asks[:, 0])
+        best_bid, best_ask = self.best_indices()
+        #new levels through the current touch that would land outside of the window 
+        origin = self.origin
+        new_bids = bid_ticks[bids[:, 1] > 0] - origin
+        new_asks = ask_ticks[asks[:, 1] > 0] - origin
+        if len(new_bids) and new_bids.max() >= self.size:
+            best_bid = new_bids.max()
+        if len(new_asks) and new_asks.min() < 0:
+            best_ask = new_asks.min()
+        self.check_window(best_bid, best_ask)
+        self.write_levels(self.bid_volumes, bid_ticks, bids)
+        self.write_levels(self.ask_volumes, ask_ticks, asks)
+        #a side emptied by the update has its new touch in the levels that were outside of the window
+        best_bid, best_ask = self.best_indices()
+        if best_bid is None and len(new_bids):
+            best_bid = int(new_bids.max()) + origin - self.origin
+        if best_ask is None and len(new_asks):
+            best_ask = int(new_asks.min()) + origin - self.origin
+        window = (self.origin, self.size)
+        self.check_window(best_bid, best_ask)
+        if window != (self.origin, self.size):
+            self.write_levels(self.bid_volumes, bid_ticks, bids)
+            self.write_levels(self.ask_volumes, ask_ticks, asks)
+        self.trim()
+        self.depth_views = {}
+
+    def trim(self):
+        """
+            Zero the levels more than max_depth levels or max_distance in price from the touch
+        """
+        if self.max_depth is None and self.max_distance is None:
+            return
+        best_bid, best_ask = self.best_indices()
+        if self.max_distance is not None:
+            ticks = int(round(self.max_distance / self.price_increment))
+            if best_bid is not None:
+                self.bid_volumes[:max(best_bid - ticks, 0)] = 0
+            if best_ask is not None:
+                self.ask_volumes[best_ask + ticks + 1:] = 0
+        if self.max_depth is not None:
+            bids = np.flatnonzero(self.bid_volumes)
+            self.bid_volumes[bids[:max(len(bids) - self.max_depth, 0)]] = 0
+            asks = np.flatnonzero(self.ask_volumes)
+            self.ask_volumes[asks[self.max_depth:]] = 0
+
+    def memory_usage(self):
+        return self.bid_volumes.nbytes + self.ask_volumes.nbytes
+
+    def check_window(self, best_bid, best_ask):
+        """
+            Recentre the window if the touch is within margin ticks of either edge, growing it if the spread
+            does not fit inside the margins
+        """
+        touch = [i for i in (best_bid, best_ask) if i is not None]
+        if len(touch) == 0:
+            return
+        size = self.fitting_size(max(touch) - min(touch))
+        if size != self.size:
+            self.resize(size, self.origin + int(sum(touch) // len(touch)))
+        elif min(touch) < self.margin or max(touch) >= self.size - self.margin:
+            self.recentre(self.origin + int(sum(touch) // len(touch)))
+
+    def mid_price(self):
+        if not self.initialised:
+            raise Exception('Orderbook not initialised')
+        return (self.sell_price() + self.buy_price()) / 2
+
+    def sell_price(self):
+        best_bid, _ = self.best_indices()
+        if best_bid is None:
+            raise ValueError('No price levels')
+        return float(self.to_prices(best_bid))
+
+    def buy_price(self):
+        _, best_ask = self.best_indices()
+        if best_ask is None:
+            raise ValueError('No price levels')
+        return float(self.to_prices(best_ask))
+
+    def get_bids(self, depth=5):
+        return self.to_prices(np.flatnonzero(self.bid_volumes)[::-1][:depth]).tolist()
+
+    def get_asks(self, depth=5):
+        return self.to_prices(np.flatnonzero(self.ask_volumes)[:depth]).tolist()
+
+    def side_levels(self, side):
+        """
+            Returns the (index, volume) arrays of a side of the book ordered from the touch outwards
+                side: 'bids' or 'asks'
+        """
+        if side == 'bids':
+            index = np.flatnonzero(self.bid_volumes)[::-1]
+            return index, self.bid_volumes[index]
+        index = np.flatnonzero(self.ask_volumes)
+        return index, self.ask_volumes[index]
+
+    def top_levels(self, depth=1):
+        bid_index, bid_volumes = self.side_levels('bids')
+        ask_index, ask_volumes = self.side_levels('asks')
+        return {
+            'bids': list(zip(self.to_prices(bid_index[:depth]).tolist(), bid_volumes[:depth].tolist())),
+            'asks': list(zip(self.to_prices(ask_index[:depth]).tolist(), ask_volumes[:depth].tolist()))
+        }
+
+    def depth_volume(self, side, ticks):
+        """
+            Total volume on a side within ticks ticks of the best price on that side
+        """
+        best_bid, best_ask = self.best_indices()
+        if side == 'bids':
+            return 0.0 if best_bid is None else float(self.bid_volumes[max(best_bid - ticks + 1, 0):best_bid + 1].sum())
+        return 0.0 if best_ask is None else float(self.ask_volumes[best_ask:best_ask + ticks].sum())
+
+    def depth_view(self, side):
+        if side not in self.depth_views:
+            index, volumes = self.side_levels(side)
+            self.depth_views[side] = self.build_depth_view(self.to_prices(index), volumes)
+        return self.depth_views[side]
 
 
 class OrderBookManager:
     """
-        Handle collections of orderbooks
+        Handle collections of orderbooks across exchanges. The best bid and offer of every book is kept
+        in numpy arrays, one row per (exchange name, market), updated from top of book notifications so
+        queries across all the books are vectorized. A row is nan while its book resyncs.
     """
+    def __init__(self):
+        self.exchanges = {}
+        self.rows = {} #{(exchange name, market): row}
+        self.keys = []
+        self.groups = {} #{group: [rows]}
+        self.callbacks = {}
+        self.bid_prices = np.full(0, np.nan)
+        self.bid_volumes = np.full(0, np.nan)
+        self.ask_prices = np.full(0, np.nan)
+        self.ask_volumes = np.full(0, np.nan)
+
+    def add_exchange(self, name, exchange):
+        """
+            Add an exchange, eg add_exchange('binance', Binance()), the exchange must already be connected
+        """
+        self.exchanges[name] = exchange
+
+    async def subscribe(self, name, *markets, group=None, **book_options):
+        """
+            Subscribe to the order books of markets on the exchange name and add them to the table
+                group: key used to compare the books across exchanges in best_venue, defaults to the market,
+                    eg group=('BTC', 'USDT') for ('BTC', 'PERP') on BinanceFutures
+                book_options: passed to the exchange subscribe_to_order_books
+        """
+        exchange = self.exchanges[name]
+        await exchange.subscribe_to_order_books(*markets, **book_options)
+        for market in markets:
+            key = (name, market)
+            if key in self.callbacks:
+                continue
+            row = self.rows[key] if key in self.rows else self.add_row(key, market if group is None else group)
+            book = exchange.order_books[market]
+            callback = lambda old, new, row=row: self.update_row(row, new)
+            self.callbacks[key] = (book, callback)
+            book.subscribe_to_top_of_book(1, callback)
+            if book.initialised:
+                self.update_row(row, book.top_levels(1))
+
+    def unsubscribe(self, name, *markets):
+        """
+            Stop tracking the books, the exchange stays subscribed to them
+        """
+        for market in markets:
+            key = (name, market)
+            if key not in self.callbacks:
+                continue
+            book, callback = self.callbacks.pop(key)
+            book.unsubscribe_from_top_of_book(callback)
+            self.update_row(self.rows[key], {'bids': [], 'asks': []})
+
+    def add_row(self, key, group):
+        row = len(self.keys)
+        if row == len(self.bid_prices):
+            capacity = max(16, 2 * row)
+            for column in ('bid_prices', 'bid_volumes', 'ask_prices', 'ask_volumes'):
+                values = np.full(capacity, np.nan)
+                values[:row] = getattr(self, column)
+                setattr(self, column, values)
+        self.rows[key] = row
+        self.keys.append(key)
+        self.groups.setdefault(group, []).append(row)
+        return row
+
+    def update_row(self, row, levels):
+        self.bid_prices[row], self.bid_volumes[row] = levels['bids'][0] if len(levels['bids']) else (np.nan, np.nan)
+        self.ask_prices[row], self.ask_volumes[row] = levels['asks'][0] if len(levels['asks']) else (np.nan, np.nan)
+
+    def mid_prices(self):
+        """
+            Returns an array of the mid price of every book, in the order of keys, nan if a side is empty
+        """
+        n = len(self.keys)
+        return (self.bid_prices[:n] + self.ask_prices[:n]) / 2
+
+    def spreads(self):
+        """
+            Returns an array of the spread of every book in basis points of the mid price
+        """
+        n = len(self.keys)
+        return (self.ask_prices[:n] - self.bid_prices[:n]) / self.mid_prices() * 10 ** 4
+
+    def widest_spreads(self, n=10):
+        """
+            Returns the n books with the widest spreads as a list of ((exchange name, market), spread in bps)
+        """
+        spreads = self.spreads()
+        rows = np.flatnonzero(~np.isnan(spreads))
+        rows = rows[np.argsort(spreads[rows])[::-1][:n]]
+        return [(self.keys[row], float(spreads[row])) for row in rows]
+
+    def best_venue(self, group):
+        """
+            Returns the books with the highest bid and lowest ask in a group as
+            {'bid': ((exchange name, market), price, volume), 'ask': (...)}, None for a side no book quotes
+        """
+        rows = np.array(self.groups[group])
+        best = {'bid': None, 'ask': None}
+        bids, asks = self.bid_prices[rows], self.ask_prices[rows]
+        if not np.isnan(bids).all():
+            row = rows[np.nanargmax(bids)]
+            best['bid'] = (self.keys[row], float(self.bid_prices[row]), float(self.bid_volumes[row]))
+        if not np.isnan(asks).all():
+            row = rows[np.nanargmin(asks)]
+            best['ask'] = (self.keys[row], float(self.ask_prices[row]), float(self.ask_volumes[row]))
+        return best
+
+    def best_venues(self):
+        """
+            Returns best_venue for every group, {group: {'bid': ..., 'ask': ...}}
+        """
+        return {group: self.best_venue(group) for group in self.groups}
+
+    def close(self):
+        for name, market in list(self.callbacks):
+            self.unsubscribe(name, market)
@@ -0,0 +1,80 @@
+'''Order book dispatch benchmark
+
+Script to compare the depth messages per second per core of applying updates inline in ws_parse
+(Binance(inline_books=True)) against the default of a queue and task per book, with many books
+
+    $ python examples/book_dispatch_benchmark.py 300 100000
+
+Decoded depth messages for the given number of books are fed to ConnectionManager.ws_q in bursts,
+as ws_listen would, and timed until every book has applied its last update.
+
+'''
+import asyncio, random, sys, time
+sys.path.append("./")
+
+from cryptobots.binance import Binance
+from cryptobots.exchanges import SpotMarket
+
+
+def make_messages(names, n, levels=10):
+    messages = []
+    update_ids = {name: 0 for name in names}
+    mids = {name: 100.0 for name in names}
+    for i in range(n):
+        name = random.choice(names)
+        mid = mids[name] = max(mids[name] + random.choice([-0.01, 0, 0.01]), 1)
+        data = {
+            'e': 'depthUpdate', 'E': i, 's': name, 'U': update_ids[name] + 1, 'u': update_ids[name] + 2,
+            'b': [[f'{mid - random.randint(1, 200) / 100:.2f}', f'{random.choice([0, random.random()]):.8f}'] for _ in range(levels)],
+            'a': [[f'{mid + random.randint(1, 200) / 100:.2f}', f'{random.choice([0, random.random()]):.8f}'] for _ in range(levels)]
+        }
+        update_ids[name] += 2
+        messages.append({'stream': f'{name.lower()}@depth@100ms', 'data': data})
+    return messages, update_ids
+
+
+async def run(inline_books, names, messages, last_ids, burst=100):
+    exchange = Binance(inline_books=inline_books)
+    for name in names:
+        market = (name[:-4], 'USDT')
+        exchange.markets[market] = SpotMarket(name[:-4], 'USDT', name)
+        exchange.market_names[name] = market
+        exchange.create_order_book(market)
+        exchange.add_stream_handler(exchange.depth_stream(market), exchange.parse_order_book_message, exchange.order_book_queues[market])
+        await exchange.order_book_queues[market].put({'initial': True, 'time': 0, 'bids': [[99.0, 1.0]], 'asks': [[101.0, 1.0]]})
+    await asyncio.gather(*[book.initialised_event.wait() for book in exchange.order_books.values()])
+    tasks = len(asyncio.all_tasks())
+    ws_q = exchange.connection_manager.ws_q
+    parse_task = asyncio.create_task(exchange.ws_parse())
+
+    start, start_cpu = time.perf_counter(), time.process_time()
+    for i in range(0, len(messages), burst):
+        for message in messages[i:i + burst]:
+            await ws_q.put(message)
+        await asyncio.sleep(0)
+    while not ws_q.empty():
+        await asyncio.sleep(0)
+    if not inline_books:
+        await asyncio.gather(*[queue.join() for queue in exchange.order_book_queues.values()])
+    elapsed, cpu = time.perf_counter() - start, time.process_time() - start_cpu
+
+    books = exchange.order_books
+    assert all(books[exchange.market_names[name]].previous_time == last_ids[name] for name in names if last_ids[name] > 0)
+    parse_task.cancel()
+    await asyncio.gather(*[book.close() for book in books.values()])
+    return elapsed, cpu, tasks
+
+
+async def main(args):
+    n_books = int(args[0]) if len(args) > 0 else 300
+    n = int(args[1]) if len(args) > 1 else 100000
+    names = [f'C{i}USDT' for i in range(n_books)]
+    messages, last_ids = make_messages(names, n)
+    print(f'{n} depth messages across {n_books} books')
+    for name, inline_books in (('queue per book', False), ('inline', True)):
+        elapsed, cpu, tasks = await run(inline_books, names, messages, last_ids)
+        print(f'{name:16} {n / cpu:10.0f} messages/s per core {n / elapsed:10.0f} messages/s {tasks:5} tasks')
+
+
+if __name__ == '__main__':
+    asyncio.run(main(sys.argv[1:]))
@@ -0,0 +1,78 @@
+'''JSON decoding benchmark
+
+Script to compare the websocket frame decoders on recorded frames. Record frames from the
+Binance combined stream with
+
+    $ python examples/json_decoding_benchmark.py --record frames.txt BTC-USDT ETH-USDT
+
+and then benchmark the decoders on them with
+
+    $ python examples/json_decoding_benchmark.py frames.txt
+
+Without a file of frames a synthetic mix of depth, trade and bookTicker frames is used.
+
+'''
+import asyncio, json, random, sys, time
+sys.path.append("./")
+
+import websockets
+
+from cryptobots.connections.decoders import get_decoder, orjson, msgspec
+
+
+async def record(path, markets, n=20000):
+    streams = [f'{base.lower()}{quote.lower()}@{stream}' for base, quote in markets for stream in ('depth@100ms', 'trade')]
+    async with websockets.connect('wss://stream.binance.com:9443/stream?streams=' + '/'.join(streams)) as ws:
+        with open(path, 'w') as f:
+            for i in range(n):
+                f.write(await ws.recv() + '\n')
+                if i % 1000 == 0:
+                    print(f'recorded {i} frames')
+
+
+def synthetic_frames(n=20000):
+    frames = []
+    for i in range(n):
+        kind = random.random()
+        if kind < 0.6:
+            data = {'e': 'depthUpdate', 'E': i, 's': 'BTCUSDT', 'U': 2 * i, 'u': 2 * i + 1,
+                    'b': [[f'{30000 - random.randint(1, 500) / 100:.8f}', f'{random.random():.8f}'] for _ in range(15)],
+                    'a': [[f'{30000 + random.randint(1, 500) / 100:.8f}', f'{random.random():.8f}'] for _ in range(15)]}
+            stream = 'btcusdt@depth@100ms'
+        elif kind < 0.9:
+            data = {'e': 'trade', 'E': i, 's': 'BTCUSDT', 't': i, 'p': '30000.01000000', 'q': '0.01200000', 'T': i, 'm': True, 'M': True}
+            stream = 'btcusdt@trade'
+        else:
+            data = {'e': 'bookTicker', 'u': i, 's': 'BTCUSDT', 'b': '29999.99', 'B': '1.2', 'a': '30000.01', 'A': '0.5', 'T': i, 'E': i}
+            stream = 'btcusdt@bookTicker'
+        frames.append(json.dumps({'stream': stream, 'data': data}, separators=(',', ':')))
+    return frames
+
+
+def main(args):
+    if len(args) > 0 and args[0] == '--record':
+        asyncio.run(record(args[1], [(a.split('-')[0], a.split('-')[1]) for a in args[2:]]))
+        return
+    if len(args) > 0:
+        with open(args[0]) as f:
+            frames = [line.strip() for line in f if line.strip()]
+    else:
+        frames = synthetic_frames()
+
+    decoders = [('json', get_decoder('json'))]
+    if orjson is not None:
+        decoders += [('orjson', get_decoder('orjson'))]
+    if msgspec is not None:
+        decoders += [('msgspec', get_decoder('msgspec')), ('msgspec typed', get_decoder(typed=True))]
+    size = sum(len(frame) for frame in frames)
+    print(f'{len(frames)} frames, {size / 10 ** 6:.1f} MB')
+    for name, decoder in decoders:
+        start = time.perf_counter()
+        for frame in frames:
+            decoder(frame)
+        elapsed = time.perf_counter() - start
+        print(f'{name:24} {len(frames) / elapsed:10.0f} frames/s {size / elapsed / 10 ** 6:8.1f} MB/s')
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
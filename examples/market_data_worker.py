@@ -0,0 +1,41 @@
+'''Market data worker
+
+Script to demonstrate running the order books in a separate process and reading the best prices
+and changed levels from shared memory
+
+    $ python examples/market_data_worker.py BTC-USDT ETH-USDT
+
+'''
+
+
+import asyncio
+
+import sys
+sys.path.append("./")
+
+
+
+from cryptobots import Binance
+
+
+
+async def main(args):
+
+    print('connecting...')
+    markets = [(a.split('-')[0], a.split('-')[1]) for a in args]
+    async with Binance() as binance:
+        print('starting market data worker')
+        worker = await binance.start_market_data_worker(*markets)
+
+        for i in range(10):
+            await asyncio.sleep(1)
+            views, dropped = worker.changed_levels()
+            print(f'{sum(len(view) for view in views)} levels changed, {dropped} dropped')
+            for market in markets:
+                time, bid, bid_volume, ask, ask_volume = worker.top_of_book(market)
+                print(f'{market[0]}-{market[1]} \t {bid_volume} @ {bid} \t | {ask_volume} @ {ask}')
+
+        print('closing connections...')
+
+if __name__=='__main__':
+    asyncio.run(main(sys.argv[1:]))
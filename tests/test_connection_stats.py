@@ -0,0 +1,81 @@
+import asyncio
+import pytest
+from cryptobots.connections import http_pool
+from cryptobots.connections.http_pool import ConnectionStats, RequestTrace, create_client
+
+
+class Clock:
+    def __init__(self):
+        self.time = 0.0
+
+    def __call__(self):
+        return self.time
+
+
+def trace_request(clock, events, new_connection):
+    clock.time = 0.0
+    trace = RequestTrace()
+    async def run():
+        for event_name, time in events(new_connection):
+            clock.time = time
+            await trace(event_name, {})
+    asyncio.run(run())
+    return trace
+
+
+def request_events(new_connection):
+    if new_connection:
+        yield 'connection.connect_tcp.started', 1.0
+        yield 'connection.connect_tcp.complete', 1.5
+        yield 'connection.start_tls.started', 1.5
+        yield 'connection.start_tls.complete', 2.0
+    yield 'http11.send_request_headers.started', 2.0
+    yield 'http11.receive_response_headers.complete', 3.0
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(http_pool.time, 'perf_counter', clock)
+    return clock
+
+
+def test_traces_time_the_handshake_only_on_new_connections(clock):
+    trace = trace_request(clock, request_events, True)
+    assert trace.new_connection
+    assert trace.connect_time() == 1.0
+    assert trace.response_time() == 1.0
+    trace = trace_request(clock, request_events, False)
+    assert not trace.new_connection
+    assert trace.connect_time() == 0.0
+    assert trace.response_time() == 1.0
+
+
+def test_stats_summarise_reuse_and_times_per_endpoint(clock):
+    stats = ConnectionStats(history=2)
+    for endpoint, new_connection in [('/api/v3/depth', True), ('/api/v3/depth', False), ('/api/v3/order', False)]:
+        trace = trace_request(clock, request_events, new_connection)
+        clock.time = 4.0
+        stats.record(endpoint, trace)
+    summary = stats.summary()
+    assert summary['requests'] == 3
+    assert summary['reused'] == pytest.approx(2 / 3)
+    assert summary['endpoints']['/api/v3/depth'] == {
+        'requests': 2, 'reused': 0.5, 'mean_connect_time': 0.5, 'mean_response_time': 1.0, 'mean_time': 4.0, 'max_time': 4.0,
+    }
+    assert summary['endpoints']['/api/v3/order']['reused'] == 1.0
+    stats.record('/api/v3/depth', trace)
+    assert stats.summary()['endpoints']['/api/v3/depth']['requests'] == 2
+
+
+def test_client_limits_update_the_defaults():
+    async def run():
+        client = create_client({'max_connections': 50})
+        try:
+            pool = client._transport._pool
+            assert pool._max_connections == 50
+            assert pool._max_keepalive_connections == http_pool.DEFAULT_LIMITS['max_keepalive_connections']
+            assert pool._keepalive_expiry == http_pool.DEFAULT_LIMITS['keepalive_expiry']
+        finally:
+            await client.aclose()
+    asyncio.run(run())
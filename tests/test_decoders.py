@@ -0,0 +1,33 @@
+import json
+import pytest
+from cryptobots.connections import get_decoder
+from cryptobots.connections import decoders
+
+DEPTH = json.dumps({'stream': 'btcusdt@depth@100ms', 'data': {'e': 'depthUpdate', 'E': 1, 's': 'BTCUSDT', 'U': 2, 'u': 3, 'b': [['99.50', '1.25']], 'a': [['100.00', '0']]}})
+REPLY = json.dumps({'result': None, 'id': 7})
+
+
+@pytest.mark.parametrize('name', ['json', 'orjson', 'msgspec'])
+def test_decoders_agree_with_json(name):
+    if getattr(decoders, name, json) is None:
+        pytest.skip(f'{name} is not installed')
+    decoder = get_decoder(name)
+    for frame in (DEPTH, REPLY, DEPTH.encode()):
+        assert decoder(frame) == json.loads(frame)
+
+
+def test_unknown_decoders_are_rejected():
+    with pytest.raises(ValueError):
+        get_decoder('yaml')
+
+
+def test_typed_decoder_decodes_depth_into_structs_and_other_frames_into_dicts():
+    if decoders.msgspec is None:
+        pytest.skip('msgspec is not installed')
+    decoder = get_decoder(typed=True)
+    message = decoder(DEPTH)
+    data = message['data']
+    assert message['stream'] == 'btcusdt@depth@100ms'
+    assert data['U'] == 2 and data['u'] == 3 and data['s'] == 'BTCUSDT' and 'pu' in data and 'x' not in data
+    assert [tuple(level) for level in data['b']] == [(99.5, 1.25)] and [tuple(level) for level in data['a']] == [(100.0, 0.0)]
+    assert decoder(REPLY) == {'result': None, 'id': 7}
@@ -0,0 +1,63 @@
+from decimal import Decimal
+import numpy as np
+import pytest
+from cryptobots.exchanges import Increment
+
+
+def test_increment_scale_and_step():
+    tick = Increment('0.01000000')
+    assert (tick.decimals, tick.scale, tick.step) == (2, 100, 1)
+    half = Increment('0.50')
+    assert (half.decimals, half.scale, half.step) == (1, 10, 5)
+    whole = Increment('10')
+    assert (whole.decimals, whole.step) == (0, 10)
+
+
+def test_parse_exchange_values():
+    tick = Increment('0.01000000')
+    assert tick.parse('30000.01000000') == 3000001
+    assert tick.parse(30000.01) == 3000001
+    assert Increment('0.5').parse('100.5') == 201
+
+
+@pytest.mark.parametrize('value, floor, ceil', [
+    (0.3, 30, 30),
+    (0.29999999, 29, 30),
+    (0.2900001, 29, 30),
+    (1.2345, 123, 124),
+])
+def test_floor_and_ceil_are_exact(value, floor, ceil):
+    tick = Increment('0.01')
+    assert tick.floor(value) == floor
+    assert tick.ceil(value) == ceil
+
+
+def test_rounding_accepts_numpy_and_decimal_values():
+    tick = Increment('0.01')
+    assert tick.floor(np.float64(1.2345)) == 123
+    assert tick.ceil(np.float32(0.5)) == 50
+    assert tick.floor(Decimal('1.2399999999999999999')) == 123
+    assert tick.to_increments(2) == 200
+
+
+def test_nearest_rounds_half_to_even():
+    half = Increment('0.5')
+    assert half.to_increments(100.25) == 200
+    assert half.to_increments(100.75) == 202
+    assert half.to_increments(100.7) == 201
+
+
+def test_format():
+    assert Increment('0.01').format(3000001) == '30000.01'
+    assert Increment('0.01').format(5) == '0.05'
+    assert Increment('0.00001').format(Increment('0.00001').floor(0.0012345)) == '0.00123'
+    assert Increment('0.5').format(201) == '100.5'
+    assert Increment('1.00000000').format(7) == '7'
+    assert Increment('10').format(3) == '30'
+    assert Increment('0.01').format(-5) == '-0.05'
+
+
+def test_round_trip_through_float():
+    lot = Increment('0.001')
+    for n in (0, 1, 999, 123456789):
+        assert lot.to_increments(lot.to_float(n)) == n
@@ -0,0 +1,53 @@
+import asyncio
+from cryptobots.binance import Binance
+from cryptobots.exchanges import SpotMarket
+from cryptobots.orderbooks import InlineUpdates, OrderBook
+
+MARKET = ('BTC', 'USDT')
+
+
+def make_exchange():
+    exchange = Binance(inline_books=True)
+    exchange.markets[MARKET] = SpotMarket('BTC', 'USDT', 'BTCUSDT')
+    exchange.market_names['BTCUSDT'] = MARKET
+    return exchange
+
+
+def test_inline_books_have_no_queue_or_task():
+    async def run():
+        exchange = make_exchange()
+        book = exchange.create_order_book(MARKET)
+        assert isinstance(exchange.order_book_queues[MARKET], InlineUpdates)
+        assert exchange.order_book_queues[MARKET].book is book
+        assert book.update_parser is None
+        await book.close()
+    asyncio.run(run())
+
+
+def test_depth_messages_are_applied_as_they_are_parsed():
+    async def run():
+        exchange = make_exchange()
+        book = exchange.create_order_book(MARKET)
+        queue = exchange.order_book_queues[MARKET]
+        await queue.put({'initial': True, 'time': 10, 'bids': [[100.0, 1.0]], 'asks': [[101.0, 1.0]]})
+        exchange.parse_order_book_message({'s': 'BTCUSDT', 'U': 11, 'u': 12, 'b': [['100.5', '2']], 'a': [['101.0', '0']]}, queue)
+        #no await between parsing and reading the book
+        assert book.previous_time == 12
+        assert book.get_bids(2) == [100.5, 100.0] and book.get_asks(1) == []
+    asyncio.run(run())
+
+
+def test_failed_inline_updates_resync_the_book():
+    async def run():
+        requests = []
+        async def resync():
+            requests.append(1)
+        book = OrderBook(None, resync=resync)
+        book.update_queue.put_nowait({'initial': True, 'time': 10, 'bids': [[100.0, 1.0]], 'asks': [[101.0, 1.0]]})
+        assert book.initialised
+        book.update_queue.put_nowait({'first': 11, 'bids': [], 'asks': []})
+        assert not book.initialised and book.resyncs == 1
+        await asyncio.sleep(0)
+        assert requests == [1]
+        await book.close()
+    asyncio.run(run())
@@ -0,0 +1,31 @@
+import asyncio
+from cryptobots.accounts import SpotAccount
+from cryptobots.binance import Binance
+from cryptobots.exchanges import Increment, SpotMarket
+
+
+def make_account():
+    exchange = Binance()
+    market = SpotMarket('BTC', 'USDT', 'BTCUSDT')
+    market.tick, market.lot, market.min_provide_size = Increment('0.01000000'), Increment('0.00100000'), 0.001
+    exchange.markets[('BTC', 'USDT')] = market
+    orders = []
+
+    async def place_order(api_key, secret_key, params):
+        orders.append(params)
+        return {'orderId': len(orders), 'status': 'NEW', 'executedQty': '0', 'side': params['side'], 'price': params['price'], 'type': 'LIMIT', 'origQty': params['quantity']}
+
+    exchange.place_order = place_order
+    return SpotAccount(('key', 'secret'), exchange, 'USDT'), orders
+
+
+def test_limit_orders_round_buys_down_and_sells_up_to_the_tick():
+    async def run():
+        account, orders = make_account()
+        await account.limit_order(('BTC', 'USDT'), 'sell', 100.004, 0.0019)
+        await account.limit_order(('BTC', 'USDT'), 'buy', 100.006, 0.0019)
+        await account.limit_order(('BTC', 'USDT'), 'sell', 100.01, 1.0)
+        assert [(o['side'], o['price'], o['quantity']) for o in orders] == [('SELL', '100.01', '0.001'), ('BUY', '100.00', '0.001'), ('SELL', '100.01', '1.000')]
+        account.running = False
+        account.update_task.cancel()
+    asyncio.run(run())
@@ -0,0 +1,42 @@
+import asyncio
+import pytest
+from cryptobots.orderbooks import OrderBook
+
+
+def make_book(bids, asks):
+    book = OrderBook(None)
+    book.handle_update({'initial': True, 'time': 10, 'bids': bids, 'asks': asks})
+    return book
+
+
+def test_saved_books_are_restored_as_they_were(tmp_path):
+    async def run():
+        path = str(tmp_path / 'BTCUSDT.book')
+        make_book([[99.5, 1.25], [99.0, 2.0]], [[100.5, 0.5]]).save(path)
+        snapshot = OrderBook.load_snapshot(path)
+        assert snapshot['time'] == 10 and snapshot['restored']
+        assert snapshot['bids'] == [[99.5, 1.25], [99.0, 2.0]] and snapshot['asks'] == [[100.5, 0.5]]
+    asyncio.run(run())
+
+
+def test_fixed_point_books_are_restored_in_ticks_and_lots(tmp_path):
+    async def run():
+        path = str(tmp_path / 'BTCUSDT.book')
+        make_book([[9950, 125], [9900, 200]], [[10050, 50]]).save(path, fixed_point=True)
+        snapshot = OrderBook.load_snapshot(path, fixed_point=True)
+        book = OrderBook(None)
+        book.handle_update(snapshot)
+        book.handle_update({'first': 11, 'time': 11, 'bids': [[9960, 10]], 'asks': []})
+        assert book.initialised
+        assert dict(book.bids) == {9900: 200, 9950: 125, 9960: 10}
+        assert all(type(price) is int and type(volume) is int for side in (book.bids, book.asks) for price, volume in side.items())
+    asyncio.run(run())
+
+
+def test_snapshots_are_only_restored_with_the_same_fixed_point(tmp_path):
+    async def run():
+        path = str(tmp_path / 'BTCUSDT.book')
+        make_book([[99.5, 1.25]], [[100.5, 0.5]]).save(path)
+        with pytest.raises(ValueError):
+            OrderBook.load_snapshot(path, fixed_point=True)
+    asyncio.run(run())
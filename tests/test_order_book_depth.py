@@ -0,0 +1,40 @@
+import asyncio
+import pytest
+from cryptobots.orderbooks import OrderBook
+
+
+def test_trimmed_books_keep_the_best_levels():
+    async def run():
+        book = OrderBook(None, max_depth=3)
+        book.handle_update({'initial': True, 'time': 1, 'bids': [[100.0 - i, 1.0] for i in range(10)], 'asks': [[101.0 + i, 1.0] for i in range(10)]})
+        assert book.bids.prices == [98.0, 99.0, 100.0] and sorted(book.bids) == [98.0, 99.0, 100.0]
+        assert book.asks.prices == [101.0, 102.0, 103.0] and sorted(book.asks) == [101.0, 102.0, 103.0]
+    asyncio.run(run())
+
+
+def make_book():
+    book = OrderBook(None)
+    book.handle_update({'initial': True, 'time': 1, 'bids': [[99.0, 1.0], [98.0, 2.0]], 'asks': [[101.0, 1.0], [102.0, 2.0]]})
+    return book
+
+
+def test_fill_price_walks_the_book():
+    async def run():
+        fill = make_book().fill_price('buy', 2.0)
+        assert fill['filled'] and fill['average_price'] == 101.5 and fill['worst_price'] == 102.0
+        assert fill['slippage'] == (101.5 - 100.0) / 100.0 * 10 ** 4
+        fill = make_book().fill_price('sell', quote_volume=99.0 + 98.0)
+        assert fill['filled'] and fill['volume'] == 2.0
+        assert not make_book().fill_price('sell', 5.0)['filled']
+    asyncio.run(run())
+
+
+def test_fill_price_rejects_invalid_orders():
+    async def run():
+        book = make_book()
+        for kwargs in ({'side': 'BUY', 'volume': 1.0}, {'side': 'buy', 'volume': 0}, {'side': 'sell', 'quote_volume': -1.0}, {'side': 'buy'}):
+            with pytest.raises(ValueError):
+                book.fill_price(**kwargs)
+        with pytest.raises(ValueError):
+            book.vwap('buy', 1.0)
+    asyncio.run(run())
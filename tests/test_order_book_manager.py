@@ -0,0 +1,29 @@
+import asyncio
+import numpy as np
+from cryptobots.orderbooks import OrderBook, OrderBookManager
+
+
+class Exchange:
+    def __init__(self, *markets):
+        self.order_books = {market: OrderBook(None) for market in markets}
+
+    async def subscribe_to_order_books(self, *markets, **book_options):
+        pass
+
+
+def test_rows_are_cleared_while_a_book_resyncs():
+    async def run():
+        market = ('BTC', 'USDT')
+        exchange = Exchange(market)
+        book = exchange.order_books[market]
+        manager = OrderBookManager()
+        manager.add_exchange('test', exchange)
+        await manager.subscribe('test', market)
+        assert np.isnan(manager.mid_prices()[0])
+        book.handle_update({'initial': True, 'time': 1, 'bids': [[99.0, 1.0]], 'asks': [[101.0, 1.0]]})
+        assert manager.mid_prices()[0] == 100.0
+        book.resync_order_book()
+        assert np.isnan(manager.mid_prices()[0])
+        book.handle_update({'initial': True, 'time': 2, 'bids': [[98.0, 1.0]], 'asks': [[100.0, 1.0]]})
+        assert manager.mid_prices()[0] == 99.0
+    asyncio.run(run())
@@ -0,0 +1,98 @@
+import asyncio
+from cryptobots.orderbooks import OrderBook
+
+
+def snapshot(time, bid=100.0, ask=101.0):
+    return {'initial': True, 'time': time, 'bids': [[bid, 1.0]], 'asks': [[ask, 1.0]]}
+
+
+def diff(first, time, bids=(), asks=(), previous=None):
+    update = {'first': first, 'time': time, 'bids': [list(b) for b in bids], 'asks': [list(a) for a in asks]}
+    if previous is not None:
+        update['previous'] = previous
+    return update
+
+
+def test_updates_are_buffered_until_the_snapshot_and_applied_after_it():
+    async def run():
+        book = OrderBook(None)
+        book.handle_update(diff(1, 3, bids=[(99.0, 5.0)]))
+        book.handle_update(diff(4, 6, bids=[(100.5, 2.0)]))
+        assert not book.initialised and len(book.unhandled_updates) == 2
+        book.handle_update(snapshot(4))
+        assert book.initialised and book.previous_time == 6
+        #the update ending before the snapshot is dropped
+        assert book.get_bids(3) == [100.5, 100.0]
+    asyncio.run(run())
+
+
+def test_missed_update_resyncs_from_a_new_snapshot():
+    async def run():
+        requests = []
+        async def resync():
+            requests.append(1)
+        book = OrderBook(None, resync=resync)
+        book.handle_update(snapshot(10))
+        book.handle_update(diff(11, 12))
+        assert book.initialised
+        book.handle_update(diff(14, 15, bids=[(100.2, 1.0)]))
+        assert not book.initialised
+        await asyncio.sleep(0)
+        assert requests == [1]
+        book.handle_update(diff(16, 17))
+        book.handle_update(snapshot(15))
+        assert book.initialised and book.previous_time == 17
+        await book.close()
+    asyncio.run(run())
+
+
+def test_futures_updates_follow_the_previous_update_id():
+    async def run():
+        book = OrderBook(None)
+        book.handle_update(snapshot(10))
+        book.handle_update(diff(8, 12, previous=7))
+        assert book.previous_time == 12
+        assert book.in_sequence(diff(13, 14, previous=12))
+        assert not book.in_sequence(diff(13, 14, previous=11))
+    asyncio.run(run())
+
+
+def test_failed_resyncs_are_retried():
+    async def run():
+        attempts = []
+        async def resync():
+            attempts.append(1)
+            if len(attempts) < 2:
+                raise ConnectionError('snapshot failed')
+            book.handle_update(snapshot(20))
+        book = OrderBook(None, resync=resync)
+        book.handle_update(snapshot(10))
+        book.handle_update(diff(12, 13))
+        await asyncio.wait_for(book.initialised_event.wait(), 2)
+        assert len(attempts) == 2 and book.previous_time == 20
+        await book.close()
+    asyncio.run(run())
+
+
+def test_buffered_updates_are_capped():
+    async def run():
+        book = OrderBook(None, max_buffered_updates=3)
+        for i in range(10):
+            book.handle_update(diff(2 * i + 1, 2 * i + 2))
+        assert [u['time'] for u in book.unhandled_updates] == [16, 18, 20]
+        #a snapshot older than the updates kept can not be used
+        book.handle_update(snapshot(2))
+        assert not book.initialised
+    asyncio.run(run())
+
+
+def test_restored_checkpoint_is_not_live_until_a_live_update_follows_it():
+    async def run():
+        book = OrderBook(None)
+        book.handle_update({**snapshot(10), 'restored': True})
+        assert not book.initialised and book.restored
+        assert not book.initialised_event.is_set()
+        book.handle_update(diff(11, 12, bids=[(100.5, 1.0)]))
+        assert book.initialised and not book.restored
+        assert book.initialised_event.is_set() and book.previous_time == 12
+    asyncio.run(run())
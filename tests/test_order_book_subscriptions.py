@@ -0,0 +1,52 @@
+import asyncio
+from cryptobots.orderbooks import OrderBook
+
+
+def snapshot(time=1):
+    return {'initial': True, 'time': time, 'bids': [[99.0, 1.0], [98.0, 1.0]], 'asks': [[101.0, 1.0], [102.0, 1.0]]}
+
+
+def test_top_of_book_subscribers_are_only_notified_of_changes():
+    async def run():
+        book = OrderBook(None)
+        notifications = []
+        book.subscribe_to_top_of_book(1, lambda old, new: notifications.append((old, new)))
+        book.handle_update(snapshot())
+        assert notifications == [(None, {'bids': [(99.0, 1.0)], 'asks': [(101.0, 1.0)]})]
+        book.handle_update({'first': 2, 'time': 2, 'bids': [[97.0, 5.0]], 'asks': []})
+        assert len(notifications) == 1
+        book.handle_update({'first': 3, 'time': 3, 'bids': [[99.5, 2.0]], 'asks': []})
+        assert notifications[-1][1]['bids'] == [(99.5, 2.0)]
+    asyncio.run(run())
+
+
+def failing_subscriber(*args):
+    raise RuntimeError('subscriber failed')
+
+
+def test_failing_subscribers_do_not_stop_inline_books():
+    async def run():
+        book = OrderBook(None)
+        levels = []
+        book.subscribe_to_top_of_book(1, failing_subscriber)
+        book.subscribe_to_levels(failing_subscriber)
+        book.subscribe_to_levels(lambda bids, asks, time, snapshot: levels.append(time))
+        book.update_queue.put_nowait(snapshot())
+        book.update_queue.put_nowait({'first': 2, 'time': 2, 'bids': [[99.5, 2.0]], 'asks': []})
+        assert book.initialised and book.resyncs == 0
+        assert book.top_levels(1)['bids'] == [(99.5, 2.0)]
+        assert levels == [1, 2]
+    asyncio.run(run())
+
+
+def test_failing_subscribers_do_not_stop_queued_books():
+    async def run():
+        queue = asyncio.Queue()
+        book = OrderBook(queue)
+        book.subscribe_to_top_of_book(1, failing_subscriber)
+        await queue.put(snapshot())
+        await queue.put({'first': 2, 'time': 2, 'bids': [[99.5, 2.0]], 'asks': []})
+        await asyncio.wait_for(queue.join(), 1)
+        assert book.initialised and book.resyncs == 0 and book.previous_time == 2
+        await book.close()
+    asyncio.run(run())
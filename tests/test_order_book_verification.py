@@ -0,0 +1,29 @@
+import asyncio
+from cryptobots.orderbooks import OrderBook
+
+
+def test_verification_depth_is_restored_when_it_stops():
+    async def run():
+        book = OrderBook(None, checksum_depth=5)
+        book.handle_update({'initial': True, 'time': 1, 'bids': [[100.0 - i, 1.0] for i in range(10)], 'asks': [[101.0 + i, 1.0] for i in range(10)]})
+        checksum = book.checksum
+        book.start_verification(2)
+        assert book.checksum_depth == 2 and book.checksum != checksum
+        assert book.verify_snapshot({'time': 1, 'bids': [[100.0, 1.0], [99.0, 1.0]], 'asks': [[101.0, 1.0], [102.0, 1.0]]})
+        book.stop_verification()
+        assert book.checksum_depth == 5 and book.checksum == checksum
+    asyncio.run(run())
+
+
+def test_books_are_correct_until_a_verification_fails():
+    async def run():
+        book = OrderBook(None)
+        assert book.correct is None
+        book.handle_update({'initial': True, 'time': 1, 'bids': [[100.0, 1.0]], 'asks': [[101.0, 1.0]]})
+        book.start_verification(1)
+        assert book.verify_snapshot({'time': 1, 'bids': [[100.0, 2.0]], 'asks': [[101.0, 1.0]]}) is False
+        book.stop_verification()
+        assert book.correct is False
+        book.resync_order_book()
+        assert book.correct is None
+    asyncio.run(run())
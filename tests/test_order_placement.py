@@ -0,0 +1,99 @@
+import asyncio
+import httpx
+import pytest
+from cryptobots.binance import Binance
+from cryptobots.connections import WebsocketRequestError
+from cryptobots.exchanges import OrderStateUnknown
+
+
+class Clock:
+    '''Server time in milliseconds that only moves when the code under test sleeps'''
+    def __init__(self, monkeypatch):
+        self.time = 1700000000000
+        self.sleeps = []
+        monkeypatch.setattr(asyncio, 'sleep', self.sleep)
+
+    def now(self):
+        return self.time
+
+    async def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.time += int(seconds * 1000)
+
+
+def make_exchange(ws_error, lookup, monkeypatch):
+    exchange = Binance(ws_orders=True)
+    exchange.ws_api.open = True
+    exchange.clock = Clock(monkeypatch)
+    posts = []
+
+    async def request(method, params):
+        raise ws_error
+
+    async def signed_get(endpoint, api_key, secret_key, **kwargs):
+        return lookup(kwargs['params'])
+
+    async def signed_post(endpoint, api_key, secret_key, **kwargs):
+        posts.append(kwargs['params'])
+        return {'orderId': 2, 'clientOrderId': kwargs['params']['newClientOrderId']}
+
+    exchange.ws_api.request = request
+    exchange.signed_get = signed_get
+    exchange.signed_post = signed_post
+    return exchange, posts
+
+
+def not_found(params):
+    request = httpx.Request('GET', 'https://api.binance.com/api/v3/order')
+    response = httpx.Response(400, json={'code': -2013, 'msg': 'Order does not exist.'}, request=request)
+    raise httpx.HTTPStatusError('400', request=request, response=response)
+
+
+def place(exchange):
+    async def run():
+        return await exchange.place_order('key', 'secret', {'symbol': 'BTCUSDT', 'side': 'BUY', 'type': 'MARKET', 'quantity': '1'})
+    return asyncio.run(run())
+
+
+def test_unanswered_order_that_was_placed_is_not_resent(monkeypatch):
+    exchange, posts = make_exchange(asyncio.TimeoutError(), lambda params: {'orderId': 1, 'clientOrderId': params['origClientOrderId']}, monkeypatch)
+    assert place(exchange)['orderId'] == 1
+    assert posts == []
+
+
+def test_unanswered_order_is_looked_up_until_it_arrives(monkeypatch):
+    lookups = []
+    def lookup(params):
+        lookups.append(params)
+        if len(lookups) < 3:
+            not_found(params)
+        return {'orderId': 1, 'clientOrderId': params['origClientOrderId']}
+    exchange, posts = make_exchange(asyncio.TimeoutError(), lookup, monkeypatch)
+    assert place(exchange)['orderId'] == 1
+    assert len(lookups) == 3 and posts == []
+    assert exchange.clock.sleeps == [0.25, 0.5]
+
+
+def test_unanswered_order_unknown_to_the_exchange_is_resent_once_it_expires(monkeypatch):
+    exchange, posts = make_exchange(ConnectionError(), not_found, monkeypatch)
+    start = exchange.clock.now()
+    response = place(exchange)
+    assert exchange.clock.now() > start + 5000
+    assert len(posts) == 1
+    assert response['clientOrderId'] == posts[0]['newClientOrderId']
+
+
+def test_failed_lookup_raises_unknown_order_state(monkeypatch):
+    def lookup(params):
+        raise httpx.ConnectTimeout('timeout')
+    exchange, posts = make_exchange(asyncio.TimeoutError(), lookup, monkeypatch)
+    with pytest.raises(OrderStateUnknown):
+        place(exchange)
+    assert posts == []
+
+
+def test_rejected_order_is_raised(monkeypatch):
+    exchange, posts = make_exchange(WebsocketRequestError(1, {'code': -2010}), not_found, monkeypatch)
+    with pytest.raises(WebsocketRequestError):
+        place(exchange)
+    assert posts == []
@@ -0,0 +1,31 @@
+import random
+import pytest
+from cryptobots.orderbooks import PriceLevels
+
+
+def test_prices_stay_sorted_through_updates():
+    random.seed(1)
+    bids, reference = PriceLevels(reverse=True), {}
+    for _ in range(2000):
+        price, volume = random.randint(1, 100) / 4, random.choice([0, 0, random.random()])
+        bids.apply([[price, volume]])
+        if volume == 0:
+            reference.pop(price, None)
+        else:
+            reference[price] = volume
+        assert bids.prices == sorted(reference) and dict(bids) == reference
+    assert bids.best() == max(reference) and bids.top(3) == sorted(reference, reverse=True)[:3]
+
+
+def test_dict_methods_keep_the_prices_in_step():
+    asks = PriceLevels({101.0: 1.0, 103.0: 2.0}, reverse=False)
+    asks[102.0] = 3.0
+    asks.setdefault(100.5, 4.0)
+    asks.update({104.0: 1.0})
+    del asks[103.0]
+    assert asks.pop(101.0) == 1.0 and asks.pop(99.0, None) is None
+    assert asks.popitem() == (104.0, 1.0)
+    assert asks.prices == [100.5, 102.0] and asks.best() == 100.5 and asks.top() == [100.5, 102.0]
+    asks.clear()
+    with pytest.raises(ValueError):
+        asks.best()
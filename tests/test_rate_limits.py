@@ -0,0 +1,17 @@
+import pytest
+from cryptobots.connections import RateLimiter
+
+RATE_LIMITS = [{'rateLimitType': 'REQUEST_WEIGHT', 'interval': 'MINUTE', 'intervalNum': 1, 'limit': 6000}]
+
+
+@pytest.mark.parametrize('endpoint, limit, weight', [
+    ('/api/v3/depth', None, 5), ('/api/v3/depth', 100, 5), ('/api/v3/depth', 500, 25), ('/api/v3/depth', '1000', 50), ('/api/v3/depth', 5000, 250),
+    ('/fapi/v1/depth', None, 10), ('/fapi/v1/depth', 20, 2), ('/fapi/v1/depth', 100, 5), ('/fapi/v1/depth', 500, 10), ('/fapi/v1/depth', 1000, 20),
+])
+def test_depth_snapshots_are_weighted_by_their_limit(endpoint, limit, weight):
+    params = {'symbol': 'BTCUSDT'} if limit is None else {'symbol': 'BTCUSDT', 'limit': limit}
+    assert RateLimiter(RATE_LIMITS).weight('GET', endpoint, params) == weight
+
+
+def test_unknown_endpoints_have_weight_one():
+    assert RateLimiter(RATE_LIMITS).weight('GET', '/api/v3/time') == 1
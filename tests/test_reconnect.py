@@ -0,0 +1,81 @@
+import asyncio
+import pytest
+from cryptobots.binance import Binance
+from cryptobots.connections import ConnectionManager
+from cryptobots.connections.connections import WebsocketConnection
+from cryptobots.orderbooks import OrderBook
+
+
+def record_sleeps(monkeypatch):
+    '''Replace asyncio.sleep so that waits are recorded and return straight away'''
+    sleeps = []
+    sleep = asyncio.sleep
+
+    async def record(seconds, *args):
+        sleeps.append(seconds)
+        await sleep(0)
+
+    monkeypatch.setattr(asyncio, 'sleep', record)
+    return sleeps
+
+
+def test_reopening_a_connection_gives_up_after_max_reconnect_attempts(monkeypatch):
+    async def run():
+        sleeps = record_sleeps(monkeypatch)
+        manager = ConnectionManager('https://api.binance.com', 'wss://stream.binance.com:9443/stream', reconnect_delay=1, max_reconnect_delay=3, max_reconnect_attempts=4)
+        attempts = []
+
+        async def open_ws_connection(connection):
+            attempts.append(connection)
+            raise OSError('connection refused')
+
+        manager.open_ws_connection = open_ws_connection
+        with pytest.raises(OSError):
+            await manager.reopen_ws_connection(WebsocketConnection(0))
+        assert len(attempts) == 4
+        assert len(sleeps) == 3 and 0.5 <= sleeps[0] <= 1 and 1 <= sleeps[1] <= 2 and 1.5 <= sleeps[2] <= 3
+    asyncio.run(run())
+
+
+def test_resyncs_wait_before_requesting_snapshots(monkeypatch):
+    async def run():
+        sleeps = record_sleeps(monkeypatch)
+        requested = []
+
+        def make_book(name):
+            async def resync():
+                requested.append(name)
+            book = OrderBook(None, resync=resync)
+            book.handle_update({'initial': True, 'time': 1, 'bids': [[99.0, 1.0]], 'asks': [[101.0, 1.0]]})
+            return book
+
+        books = [make_book(i) for i in range(3)]
+        for i, book in enumerate(books):
+            book.resync_order_book(wait=i * 0.05)
+        assert not any(book.initialised for book in books)
+        await asyncio.gather(*[book.resync_task for book in books])
+        assert sorted(requested) == [0, 1, 2]
+        assert sorted(sleeps) == [0.05, 0.1]
+    asyncio.run(run())
+
+
+def test_reconnecting_websockets_spreads_the_book_resyncs(monkeypatch):
+    async def run():
+        sleeps = record_sleeps(monkeypatch)
+        exchange = Binance(inline_books=True)
+        snapshots = []
+        for i in range(3):
+            async def resync(i=i):
+                snapshots.append(i)
+            book = exchange.order_books[('C%d' % i, 'USDT')] = OrderBook(None, resync=resync)
+            book.handle_update({'initial': True, 'time': 1, 'bids': [[99.0, 1.0]], 'asks': [[101.0, 1.0]]})
+
+        async def reconnect():
+            pass
+
+        exchange.connection_manager.reconnect = reconnect
+        await exchange.reconnect_websockets(resync_interval=0.2)
+        assert not any(book.initialised for book in exchange.order_books.values())
+        await asyncio.gather(*[book.resync_task for book in exchange.order_books.values()])
+        assert sorted(snapshots) == [0, 1, 2] and sorted(sleeps) == [0.2, 0.4]
+    asyncio.run(run())
@@ -0,0 +1,77 @@
+import asyncio
+from cryptobots.connections import RequestScheduler
+from cryptobots.connections.scheduling import PriorityLock, request_class
+
+
+def test_requests_are_classed_by_endpoint_and_api_key():
+    assert request_class('POST', '/api/v3/order', {'X-MBX-APIKEY': 'key'}) == 'order'
+    assert request_class('DELETE', '/fapi/v1/order') == 'order'
+    assert request_class('GET', '/api/v3/account', {'X-MBX-APIKEY': 'key'}) == 'account'
+    assert request_class('GET', '/api/v3/depth') == 'market_data'
+
+
+def test_freed_slots_go_to_the_highest_priority_class():
+    async def run():
+        scheduler = RequestScheduler(max_concurrency=1)
+        order = []
+        async def request(c):
+            async with scheduler.slot(c):
+                order.append(c)
+                await asyncio.sleep(0)
+        await scheduler.acquire('market_data')
+        tasks = [asyncio.create_task(request(c)) for c in ['market_data', 'account', 'order']]
+        await asyncio.sleep(0)
+        assert order == []
+        assert scheduler.metrics()['order']['waiting'] == 1
+        scheduler.release('market_data')
+        await asyncio.gather(*tasks)
+        assert order == ['order', 'account', 'market_data']
+        assert scheduler.metrics()['market_data']['requests'] == 2
+        assert all(m['active'] == 0 and m['waiting'] == 0 for m in scheduler.metrics().values())
+    asyncio.run(run())
+
+
+def test_class_caps_leave_room_for_other_classes():
+    async def run():
+        scheduler = RequestScheduler(max_concurrency=10, class_concurrency={'market_data': 1})
+        await scheduler.acquire('market_data')
+        waiting = asyncio.create_task(scheduler.acquire('market_data'))
+        await asyncio.sleep(0)
+        assert not waiting.done()
+        await asyncio.wait_for(scheduler.acquire('account'), 1)
+        assert scheduler.active == {'order': 0, 'account': 1, 'market_data': 1}
+        scheduler.release('market_data')
+        await asyncio.wait_for(waiting, 1)
+        assert scheduler.active['market_data'] == 1
+    asyncio.run(run())
+
+
+def test_cancelled_waiters_do_not_hold_a_slot():
+    async def run():
+        scheduler = RequestScheduler(max_concurrency=1)
+        await scheduler.acquire('order')
+        cancelled = asyncio.create_task(scheduler.acquire('order'))
+        await asyncio.sleep(0)
+        cancelled.cancel()
+        await asyncio.gather(cancelled, return_exceptions=True)
+        scheduler.release('order')
+        await asyncio.wait_for(scheduler.acquire('market_data'), 1)
+        assert scheduler.active == {'order': 0, 'account': 0, 'market_data': 1}
+    asyncio.run(run())
+
+
+def test_priority_lock_wakes_the_lowest_priority_value_first():
+    async def run():
+        lock = PriorityLock()
+        order = []
+        async def hold(name, priority):
+            async with lock.hold(priority):
+                order.append(name)
+        await lock.acquire()
+        tasks = [asyncio.create_task(hold(name, priority)) for name, priority in [('a', 2), ('b', 0), ('c', 2), ('d', 1)]]
+        await asyncio.sleep(0)
+        lock.release()
+        await asyncio.gather(*tasks)
+        assert order == ['b', 'd', 'a', 'c']
+        assert not lock.locked
+    asyncio.run(run())
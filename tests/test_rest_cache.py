@@ -0,0 +1,61 @@
+import asyncio
+import httpx
+from cryptobots.connections import ConnectionManager
+
+
+def make_manager(**options):
+    state = {'requests': 0, 'balance': 1, 'release': None}
+
+    async def handler(request):
+        state['requests'] += 1
+        balance = state['balance']
+        if state['release'] is not None:
+            await state['release'].wait()
+        return httpx.Response(200, json={'balance': balance})
+
+    manager = ConnectionManager('https://api.binance.com', **options)
+    manager.httpx_client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return manager, state
+
+
+def test_concurrent_gets_share_one_request_and_get_their_own_copy():
+    async def run():
+        manager, state = make_manager()
+        first, second = await asyncio.gather(manager.rest_get('/api/v3/account'), manager.rest_get('/api/v3/account'))
+        assert state['requests'] == 1
+        assert first == second == {'balance': 1}
+        first['balance'] = 2
+        assert second['balance'] == 1
+    asyncio.run(run())
+
+
+def test_cached_responses_are_reused_until_invalidated():
+    async def run():
+        manager, state = make_manager(cache_ttls={'/api/v3/account': 60})
+        (await manager.rest_get('/api/v3/account'))['balance'] = 5
+        assert await manager.rest_get('/api/v3/account') == {'balance': 1}
+        assert state['requests'] == 1
+        state['balance'] = 2
+        manager.invalidate('/api/v3/account')
+        assert await manager.rest_get('/api/v3/account') == {'balance': 2}
+        assert state['requests'] == 2
+    asyncio.run(run())
+
+
+def test_gets_after_invalidation_do_not_join_earlier_requests():
+    async def run():
+        manager, state = make_manager(cache_ttls={'/api/v3/account': 60})
+        state['release'] = asyncio.Event()
+        before = asyncio.create_task(manager.rest_get('/api/v3/account'))
+        await asyncio.sleep(0.01)
+        state['balance'] = 2
+        manager.invalidate('/api/v3/account')
+        after = asyncio.create_task(manager.rest_get('/api/v3/account'))
+        await asyncio.sleep(0.01)
+        state['release'].set()
+        assert await before == {'balance': 1}
+        assert await after == {'balance': 2}
+        assert state['requests'] == 2
+        #the response started before the invalidation is not cached
+        assert await manager.rest_get('/api/v3/account') == {'balance': 2}
+    asyncio.run(run())
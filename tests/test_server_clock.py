@@ -0,0 +1,33 @@
+import asyncio
+import httpx
+import pytest
+from cryptobots.connections import ConnectionManager, ServerClock
+
+
+def test_clock_sync_requests_are_market_data_requests():
+    async def run():
+        async def handler(request):
+            return httpx.Response(200, json={'serverTime': 1700000000000})
+
+        manager = ConnectionManager('https://api.binance.com')
+        manager.httpx_client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        classes = []
+        slot = manager.scheduler.slot
+
+        def record(priority_class):
+            classes.append(priority_class)
+            return slot(priority_class)
+
+        manager.scheduler.slot = record
+        clock = ServerClock(manager, '/api/v3/time', samples=3)
+        await clock.sync()
+        assert classes == ['market_data'] * 3
+        assert len(clock.history) == 3 and clock.round_trip is not None
+    asyncio.run(run())
+
+
+def test_offset_is_taken_from_the_shortest_round_trip():
+    clock = ServerClock()
+    clock.add_sample(10500, 10.0, 10.2)
+    clock.add_sample(20100, 20.0, 20.01)
+    assert clock.round_trip == pytest.approx(10.0) and clock.offset == pytest.approx(95.0)
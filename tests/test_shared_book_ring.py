@@ -0,0 +1,55 @@
+import asyncio
+import numpy as np
+from cryptobots.market_data import SharedBookRing, BID, ASK, SNAPSHOT, level_publisher, top_of_book_publisher
+from cryptobots.orderbooks import OrderBook
+
+
+def test_top_of_book_is_read_from_another_attachment():
+    ring = SharedBookRing(2, capacity=8)
+    reader = SharedBookRing(name=ring.name)
+    try:
+        assert reader.top_of_book(1) is None
+        ring.write_top_of_book(1, 5, 99.0, 1.0, 101.0, 2.0)
+        assert reader.top_of_book(1) == (5, 99.0, 1.0, 101.0, 2.0)
+        assert reader.top_of_book(0) is None
+    finally:
+        reader.close()
+        ring.close()
+
+
+def test_levels_wrap_around_the_ring_and_report_dropped_records():
+    ring = SharedBookRing(1, capacity=4)
+    try:
+        ring.write_levels(0, BID, [[99.0, 1.0], [98.0, 2.0], [97.0, 3.0]], 1)
+        views, cursor, dropped = ring.read_levels(0)
+        assert cursor == 3 and dropped == 0 and views[0]['price'].tolist() == [99.0, 98.0, 97.0]
+        ring.write_levels(0, ASK, [[101.0, 1.0], [102.0, 1.0]], 2)
+        views, cursor, dropped = ring.read_levels(cursor)
+        assert cursor == 5 and dropped == 0
+        assert np.concatenate(views)['price'].tolist() == [101.0, 102.0] and len(views) == 2
+        assert all(SharedBookRing.valid(view, 3) for view in views)
+        ring.write_levels(0, ASK, [[103.0, 1.0]] * 3, 3)
+        ring.write_levels(0, ASK, [[104.0, 1.0]] * 3, 4)
+        views, cursor, dropped = ring.read_levels(5)
+        assert cursor == 11 and dropped == 2
+        assert np.concatenate(views)['price'].tolist() == [103.0, 104.0, 104.0, 104.0]
+    finally:
+        ring.close()
+
+
+def test_publishers_write_snapshots_and_changes_of_a_book():
+    async def run():
+        ring = SharedBookRing(1, capacity=16)
+        try:
+            book = OrderBook(None)
+            book.subscribe_to_levels(level_publisher(ring, 0))
+            book.subscribe_to_top_of_book(1, top_of_book_publisher(ring, 0, book))
+            book.handle_update({'initial': True, 'time': 1, 'bids': [[99.0, 1.0]], 'asks': [[101.0, 2.0]]})
+            book.handle_update({'first': 2, 'time': 2, 'bids': [[99.5, 3.0]], 'asks': []})
+            records = np.concatenate(ring.read_levels(0)[0])
+            assert records['side'].tolist() == [BID | SNAPSHOT, ASK, BID]
+            assert records['price'].tolist() == [99.0, 101.0, 99.5] and records['time'].tolist() == [1, 1, 2]
+            assert ring.top_of_book(0) == (2, 99.5, 3.0, 101.0, 2.0)
+        finally:
+            ring.close()
+    asyncio.run(run())
@@ -0,0 +1,60 @@
+import asyncio
+from cryptobots.binance import Binance
+
+
+async def dispatch(exchange, messages):
+    '''Run ws_parse until it has handled messages'''
+    ws_q = exchange.connection_manager.ws_q
+    for message in messages:
+        ws_q.put_nowait(message)
+    task = asyncio.create_task(exchange.ws_parse())
+    while not ws_q.empty():
+        await asyncio.sleep(0)
+    await asyncio.sleep(0)
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+
+
+def test_messages_are_routed_by_exact_stream_name():
+    async def run():
+        exchange = Binance()
+        trades, depth, fast_depth = asyncio.Queue(), [], []
+        exchange.add_stream_handler('btcusdt@trade', exchange.parse_trade_message, trades)
+        exchange.add_stream_handler('btcusdt@depth', lambda data, target: target.append(data['u']), depth)
+        exchange.add_stream_handler('btcusdt@depth@100ms', lambda data, target: target.append(data['u']), fast_depth)
+        await dispatch(exchange, [
+            {'stream': 'btcusdt@depth@100ms', 'data': {'u': 1}},
+            {'stream': 'btcusdt@trade', 'data': {'T': 5, 'p': '100.5', 'q': '2', 'm': True}},
+            {'stream': 'btcusdt@depth', 'data': {'u': 2}},
+            {'stream': 'ethusdt@depth', 'data': {'u': 3}},
+            {'result': None, 'id': 1},
+        ])
+        assert depth == [2] and fast_depth == [1]
+        trade = trades.get_nowait()
+        assert (trade.time, trade.price, trade.volume) == (5, 100.5, 2.0)
+    asyncio.run(run())
+
+
+def test_coroutine_handlers_are_awaited():
+    async def run():
+        exchange = Binance()
+        handled = []
+        async def handler(data, target):
+            await asyncio.sleep(0)
+            handled.append((data, target))
+        exchange.add_stream_handler('key', handler)
+        await dispatch(exchange, [{'stream': 'key', 'data': {'e': 'outboundAccountPosition'}}])
+        assert handled == [({'e': 'outboundAccountPosition'}, None)]
+    asyncio.run(run())
+
+
+def test_removed_streams_are_ignored():
+    async def run():
+        exchange = Binance()
+        handled = []
+        exchange.add_stream_handler('btcusdt@depth', lambda data, target: handled.append(data))
+        exchange.remove_stream_handler('btcusdt@depth')
+        exchange.remove_stream_handler('btcusdt@depth')
+        await dispatch(exchange, [{'stream': 'btcusdt@depth', 'data': {'u': 1}}])
+        assert handled == [] and exchange.stream_handlers == {}
+    asyncio.run(run())
@@ -0,0 +1,31 @@
+import random
+from cryptobots.connections.connections import StreamMove
+
+
+def move(source_frames, target_frames, seed):
+    random.seed(seed)
+    source, target = object(), object()
+    stream_move = StreamMove(source, target)
+    pending = [(source, list(source_frames)), (target, list(target_frames))]
+    passed_on = []
+    while any(frames for _, frames in pending):
+        connection, frames = random.choice([p for p in pending if p[1]])
+        frame = frames.pop(0)
+        passed_on += stream_move.receive(connection, frame, {'u': frame})
+    return [message['u'] for message in passed_on + stream_move.finish()]
+
+
+def test_moving_streams_pass_each_message_on_once_in_order():
+    for seed in range(200):
+        assert move([1, 2, 3, 4, 5], [3, 4, 5, 6, 7], seed) == [1, 2, 3, 4, 5, 6, 7]
+        assert move([1, 2], [1, 2, 3], seed) == [1, 2, 3]
+        assert move([1, 2, 3], [2, 3, 4], seed) == [1, 2, 3, 4]
+
+
+def test_target_messages_are_passed_on_when_source_stops_first():
+    assert move([1, 2], [], 0) == [1, 2]
+    source, target = object(), object()
+    stream_move = StreamMove(source, target)
+    assert stream_move.receive(target, 3, 3) == []
+    assert stream_move.receive(source, 2, 2) == [2]
+    assert stream_move.finish() == [3]
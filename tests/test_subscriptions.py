@@ -0,0 +1,43 @@
+import asyncio
+import pytest
+from cryptobots.binance import Binance
+from cryptobots.connections import WebsocketRequestError
+from cryptobots.exchanges import SpotMarket
+
+
+def make_exchange():
+    exchange = Binance()
+    exchange.markets[('BTC', 'USDT')] = SpotMarket('BTC', 'USDT', 'BTCUSDT')
+    exchange.market_names['BTCUSDT'] = ('BTC', 'USDT')
+    sent = []
+
+    async def ws_send(request, connection=None):
+        sent.append(request)
+        rejected = asyncio.get_running_loop().create_future()
+        rejected.set_exception(WebsocketRequestError(request, {'code': 2, 'msg': 'Invalid request'}))
+        return rejected
+
+    async def rest_post(endpoint, **kwargs):
+        return {'listenKey': 'key'}
+
+    exchange.connection_manager.ws_send = ws_send
+    exchange.connection_manager.rest_post = rest_post
+    return exchange, sent
+
+
+def test_rejected_trade_subscriptions_are_raised():
+    async def run():
+        exchange, sent = make_exchange()
+        with pytest.raises(WebsocketRequestError):
+            await exchange.subscribe_to_trade_streams(('BTC', 'USDT'))
+        assert sent[0]['params'] == ['btcusdt@trade']
+    asyncio.run(run())
+
+
+def test_rejected_user_data_subscriptions_are_raised():
+    async def run():
+        exchange, sent = make_exchange()
+        with pytest.raises(WebsocketRequestError):
+            await exchange.subscribe_to_user_data('api key', 'secret key')
+        assert sent[0]['params'] == ['key'] and exchange.user_ping_tasks == {}
+    asyncio.run(run())
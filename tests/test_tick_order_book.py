@@ -0,0 +1,51 @@
+import asyncio
+from cryptobots.orderbooks import TickOrderBook
+
+
+def make_book(bids, asks, size=64):
+    book = TickOrderBook(None, 0.01, size=size)
+    book.handle_update({'initial': True, 'time': 1, 'bids': bids, 'asks': asks})
+    return book
+
+
+def test_window_recentres_when_the_touch_drifts():
+    async def run():
+        book = make_book([[100.00, 1.0], [99.95, 2.0]], [[100.01, 1.0], [100.20, 3.0]])
+        origin = book.origin
+        #the touch moves 0.25 up, within the 8 tick margin of the top of the 64 tick window
+        book.handle_update({'first': 2, 'time': 2, 'bids': [[100.25, 1.5]], 'asks': [[100.01, 0], [100.20, 0], [100.26, 2.0]]})
+        assert book.origin > origin
+        assert book.sell_price() == 100.25 and book.buy_price() == 100.26
+        assert book.bids == {99.95: 2.0, 100.0: 1.0, 100.25: 1.5} and book.asks == {100.26: 2.0}
+    asyncio.run(run())
+
+
+def test_levels_falling_out_of_the_window_are_dropped_from_one_side_only():
+    async def run():
+        book = make_book([[100.00, 1.0], [99.75, 2.0]], [[100.01, 1.0], [100.02, 3.0]])
+        book.handle_update({'first': 2, 'time': 2, 'bids': [[100.40, 1.0]], 'asks': [[100.01, 0], [100.02, 0], [100.41, 2.0]]})
+        #the window is now centred on 100.40, so 99.75 is more than 32 ticks below it
+        assert 99.75 not in book.bids and book.bids[100.0] == 1.0
+        assert book.asks == {100.41: 2.0}
+        assert book.top_levels(2) == {'bids': [(100.4, 1.0), (100.0, 1.0)], 'asks': [(100.41, 2.0)]}
+    asyncio.run(run())
+
+
+def test_snapshots_with_a_spread_wider_than_the_window_keep_both_touches():
+    async def run():
+        book = make_book([[1.00, 1.0], [0.99, 2.0]], [[5.00, 1.0]])
+        assert book.size >= 512
+        assert book.sell_price() == 1.0 and book.buy_price() == 5.0
+        assert book.level_count() == 2
+        book.handle_update({'first': 2, 'time': 2, 'bids': [], 'asks': [[5.10, 1.0]]})
+        assert book.buy_price() == 5.0 and book.asks == {5.0: 1.0, 5.1: 1.0}
+    asyncio.run(run())
+
+
+def test_updates_that_widen_the_spread_grow_the_window():
+    async def run():
+        book = make_book([[100.00, 1.0]], [[100.01, 1.0]])
+        book.handle_update({'first': 2, 'time': 2, 'bids': [[100.00, 0], [99.00, 1.0]], 'asks': []})
+        assert book.sell_price() == 99.0 and book.buy_price() == 100.01
+        assert book.size > 64
+    asyncio.run(run())
@@ -0,0 +1,51 @@
+import asyncio
+from cryptobots.orderbooks import OrderBook
+
+SNAPSHOT = {'initial': True, 'time': 1, 'bids': [[99.0, 1.0], [98.0, 1.0]], 'asks': [[101.0, 1.0], [102.0, 1.0]]}
+DIFFS = [
+    {'first': 2, 'time': 3, 'bids': [[99.0, 2.0]], 'asks': [[100.5, 1.0]]},
+    {'first': 4, 'time': 4, 'bids': [[99.0, 0], [99.5, 1.0]], 'asks': []},
+    {'first': 5, 'time': 6, 'bids': [[98.0, 3.0]], 'asks': [[100.5, 0]]},
+]
+
+
+def test_consecutive_diffs_merge_keeping_the_last_volume_of_each_level():
+    merged = list(OrderBook.merge_updates(DIFFS))
+    assert len(merged) == 1
+    assert merged[0]['first'] == 2 and merged[0]['time'] == 6
+    assert sorted(merged[0]['bids']) == [(98.0, 3.0), (99.0, 0), (99.5, 1.0)] and merged[0]['asks'] == [(100.5, 0)]
+
+
+def test_snapshots_and_gaps_are_not_merged():
+    gap = {'first': 8, 'time': 9, 'bids': [], 'asks': []}
+    merged = list(OrderBook.merge_updates([SNAPSHOT] + DIFFS[:2] + [gap]))
+    assert merged[0] is SNAPSHOT and merged[1]['time'] == 4 and merged[2]['first'] == 8
+
+
+def test_batches_leave_the_book_as_single_updates_do_and_notify_once():
+    async def run():
+        single, batched = OrderBook(None), OrderBook(None)
+        notifications = []
+        batched.subscribe_to_top_of_book(1, lambda old, new: notifications.append(new))
+        for update in [SNAPSHOT] + DIFFS:
+            single.handle_update(update)
+        batched.handle_updates([SNAPSHOT] + DIFFS)
+        assert dict(batched.bids) == dict(single.bids) == {98.0: 3.0, 99.5: 1.0}
+        assert dict(batched.asks) == dict(single.asks) and batched.previous_time == 6
+        assert notifications == [{'bids': [(99.5, 1.0)], 'asks': [(101.0, 1.0)]}]
+    asyncio.run(run())
+
+
+def test_queued_books_drain_their_queue_in_batches():
+    async def run():
+        queue = asyncio.Queue()
+        book = OrderBook(queue, batch_updates=True)
+        batches = []
+        handle_updates = book.handle_updates
+        book.handle_updates = lambda updates: batches.append(len(updates)) or handle_updates(updates)
+        for update in [SNAPSHOT] + DIFFS:
+            queue.put_nowait(update)
+        await asyncio.wait_for(queue.join(), 1)
+        assert batches == [4] and book.previous_time == 6
+        await book.close()
+    asyncio.run(run())